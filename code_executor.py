@@ -4,11 +4,11 @@ Executes Python code in a controlled environment and captures output and errors.
 """
 
 import os
+import re
 import sys
 import subprocess
 import tempfile
 import logging
-import time
 import signal
 from typing import Dict, Any, Optional
 from contextlib import redirect_stdout, redirect_stderr
@@ -16,6 +16,28 @@ import io
 
 logger = logging.getLogger(__name__)
 
+_NAME_ERROR_RE = re.compile(r"NameError: name '(\w+)' is not defined")
+_STRAY_FENCE_RE = re.compile(r"^\s*```[\w+-]*\s*$", re.MULTILINE)
+
+# Imports for names LLM-generated code commonly uses without importing
+_KNOWN_NAME_IMPORTS = {
+    'pd': 'import pandas as pd',
+    'np': 'import numpy as np',
+    'plt': 'import matplotlib.pyplot as plt',
+    'sns': 'import seaborn as sns',
+    'json': 'import json',
+    're': 'import re',
+    'math': 'import math',
+    'datetime': 'import datetime',
+    'base64': 'import base64',
+    'io': 'import io',
+    'os': 'import os',
+    'sys': 'import sys',
+    'requests': 'import requests',
+    'BytesIO': 'from io import BytesIO',
+    'StringIO': 'from io import StringIO',
+}
+
 class CodeExecutor:
     """
     Safely executes Python code generated by the LLM.
@@ -46,13 +68,14 @@ class CodeExecutor:
             'getattr', 'hasattr', 'globals', 'locals', 'vars', 'dir'
         }
     
-    def execute_code(self, code: str, use_subprocess: bool = True) -> Dict[str, Any]:
+    def execute_code(self, code: str, use_subprocess: bool = True, prepared: bool = False) -> Dict[str, Any]:
         """
         Execute Python code and capture the results.
         
         Args:
             code: Python code to execute
             use_subprocess: Whether to use subprocess isolation (recommended)
+            prepared: Code already went through prepare_code, so skip re-preparing it
             
         Returns:
             Dictionary with execution results
@@ -68,7 +91,7 @@ class CodeExecutor:
             }
         
         # Clean and prepare code
-        cleaned_code = self._prepare_code(code)
+        cleaned_code = code if prepared else self._prepare_code(code)
         
         if use_subprocess:
             return self._execute_with_subprocess(cleaned_code)
@@ -78,6 +101,32 @@ class CodeExecutor:
     def prepare_code(self, code: str) -> str:
         """Public wrapper for code preparation (used before syntax validation)."""
         return self._prepare_code(code)
+
+    def apply_local_fixes(self, code: str, error: str) -> Optional[str]:
+        """
+        Try to repair trivially broken code without an LLM round-trip.
+        
+        Args:
+            code: Code that failed syntax validation or execution
+            error: The syntax or runtime error message
+            
+        Returns:
+            The fixed code if a fix applied and it compiles, otherwise None
+        """
+        fixed = code
+
+        # Leftover Markdown fence lines from partially fenced LLM output
+        if 'syntax' in (error or '').lower():
+            fixed = _STRAY_FENCE_RE.sub('', fixed)
+
+        # Missing import for a well-known module alias
+        name_error = _NAME_ERROR_RE.search(error or '')
+        if name_error and name_error.group(1) in _KNOWN_NAME_IMPORTS:
+            fixed = _KNOWN_NAME_IMPORTS[name_error.group(1)] + '\n' + fixed
+
+        if fixed == code or not self.validate_code_syntax(fixed)["valid"]:
+            return None
+        return fixed
     
     def _security_check(self, code: str) -> bool:
         """
@@ -206,10 +255,11 @@ class CodeExecutor:
         # Write code to temporary file
         # Ensure output directory exists
         os.makedirs(self.output_dir, exist_ok=True)
-        script_path = os.path.join(self.output_dir, f'temp_script_{int(time.time())}.py')
+        # Unique name per run: speculative corrections execute several scripts at once
+        fd, script_path = tempfile.mkstemp(prefix='temp_script_', suffix='.py', dir=self.output_dir)
         
         try:
-            with open(script_path, 'w', encoding='utf-8') as f:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 f.write(code)
             
             # Execute with timeout
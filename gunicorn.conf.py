@@ -0,0 +1,23 @@
+"""
+Gunicorn configuration for serving the Flask app in production.
+Run with: gunicorn -c gunicorn.conf.py main:app
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Threaded workers so concurrent /api requests overlap their LLM waits
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', '8'))
+
+# A request can span several LLM calls plus code execution (CODE_EXECUTION_TIMEOUT 120 s)
+timeout = int(os.environ.get('WEB_TIMEOUT', '600'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
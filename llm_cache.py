@@ -0,0 +1,145 @@
+"""
+LLM Cache module - Reuses responses for repeated or near-duplicate prompts.
+Exact repeats are served from a hash lookup; near-duplicates can optionally be
+matched by embedding cosine similarity.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# (exact key, normalized embedding or None) returned by lookup and passed back to store
+CacheToken = Tuple[str, Optional[np.ndarray]]
+
+
+class SemanticCache:
+    """
+    Bounded in-memory cache of LLM responses.
+    Entries are evicted oldest-first once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = 256, semantic: bool = False,
+                 threshold: float = 0.95, embedding_model: str = 'models/text-embedding-004'):
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.threshold = threshold
+        self.embedding_model = embedding_model
+        self._entries: "OrderedDict[str, Tuple[Optional[np.ndarray], str]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt: str, system_message: Optional[str], namespace: str = '') -> str:
+        """Build the exact-match key for a prompt."""
+        digest = hashlib.sha256()
+        for part in (namespace, system_message or '', prompt):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def lookup(self, prompt: str, system_message: Optional[str] = None,
+               namespace: str = '') -> Tuple[Optional[str], CacheToken]:
+        """
+        Look up a cached response.
+
+        Returns:
+            (cached response or None, token to pass to store on a miss)
+        """
+        key = self.make_key(prompt, system_message, namespace)
+        hit = self._get_exact(key)
+        if hit is not None or not self.semantic:
+            return hit, (key, None)
+
+        embedding = self._embed(self._embedding_text(prompt, system_message))
+        return self._search(embedding), (key, embedding)
+
+    async def alookup(self, prompt: str, system_message: Optional[str] = None,
+                      namespace: str = '') -> Tuple[Optional[str], CacheToken]:
+        """Async variant of lookup."""
+        key = self.make_key(prompt, system_message, namespace)
+        hit = self._get_exact(key)
+        if hit is not None or not self.semantic:
+            return hit, (key, None)
+
+        embedding = await self._aembed(self._embedding_text(prompt, system_message))
+        return self._search(embedding), (key, embedding)
+
+    def store(self, token: CacheToken, response: str) -> None:
+        """Store a response under the token returned by lookup."""
+        if not response:
+            return
+        key, embedding = token
+        with self._lock:
+            self._entries[key] = (embedding, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._matrix_keys = []
+
+    def _get_exact(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            logger.info("LLM cache hit (exact)")
+            return entry[1]
+
+    def _search(self, embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Return the most similar cached response if it clears the threshold."""
+        if embedding is None:
+            return None
+        with self._lock:
+            if self._matrix is None:
+                self._matrix_keys = [k for k, (vec, _) in self._entries.items() if vec is not None]
+                self._matrix = (np.vstack([self._entries[k][0] for k in self._matrix_keys])
+                                if self._matrix_keys else np.empty((0, embedding.shape[0])))
+            if not self._matrix_keys:
+                return None
+            # Vectors are unit-normalized, so the dot product is the cosine similarity
+            scores = self._matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            logger.info(f"LLM cache hit (semantic, score={scores[best]:.3f})")
+            return self._entries[self._matrix_keys[best]][1]
+
+    @staticmethod
+    def _embedding_text(prompt: str, system_message: Optional[str]) -> str:
+        return f"{system_message}\n\n{prompt}" if system_message else prompt
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            result = genai.embed_content(model=self.embedding_model, content=text)
+            return self._normalize(result['embedding'])
+        except Exception as e:
+            logger.warning(f"Embedding failed, skipping semantic cache: {str(e)}")
+            return None
+
+    async def _aembed(self, text: str) -> Optional[np.ndarray]:
+        try:
+            result = await genai.embed_content_async(model=self.embedding_model, content=text)
+            return self._normalize(result['embedding'])
+        except Exception as e:
+            logger.warning(f"Embedding failed, skipping semantic cache: {str(e)}")
+            return None
+
+    @staticmethod
+    def _normalize(vector: Any) -> Optional[np.ndarray]:
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(arr))
+        return arr / norm if norm else None
@@ -4,18 +4,69 @@ Formats requests and handles responses from the model.
 """
 
 import os
+import asyncio
+import functools
+import hashlib
 import logging
+import random
+import threading
 import time
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from io import StringIO
+from typing import Optional, Dict, Any, Callable, Iterator
 from dotenv import load_dotenv
 
 import google.generativeai as genai
 
+from llm_cache import SemanticCache
+
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+class TokenBucket:
+    """
+    Client-side limiter for requests per minute and tokens per minute.
+    Uses a thread lock rather than an asyncio lock because sync callers on other
+    threads share the same budget as the pipeline's event loop.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve capacity for one request; returns how many seconds to wait before sending it."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated
+            self._updated = now
+            wait = 0.0
+            if self.rpm > 0:
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60) - 1
+                wait = max(wait, -self._requests * 60 / self.rpm)
+            if self.tpm > 0:
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60) - min(tokens, self.tpm)
+                wait = max(wait, -self._tokens * 60 / self.tpm)
+            return wait
+
+    def acquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            logger.info(f"Rate limiter delaying LLM call by {wait:.2f}s")
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            logger.info(f"Rate limiter delaying LLM call by {wait:.2f}s")
+            await asyncio.sleep(wait)
+
 class LLMHandler:
     """
     Handles all communication with Google Gemini models.
@@ -29,6 +80,36 @@ class LLMHandler:
         self.temperature = float(os.getenv('TEMPERATURE', '0.7'))
         self.max_retries = int(os.getenv('MAX_RETRIES', '3'))
         self.retry_delay = int(os.getenv('RETRY_DELAY', '1'))
+        self.max_retry_delay = float(os.getenv('MAX_RETRY_DELAY', '30'))
+        # 0 disables the corresponding limit
+        self.rate_limiter = TokenBucket(
+            rpm=int(os.getenv('GEMINI_RPM', '60')),
+            tpm=int(os.getenv('GEMINI_TPM', '1000000')),
+        )
+        self.generation_config = {
+            "temperature": self.temperature,
+            "max_output_tokens": self.max_tokens,
+        }
+
+        # Models are cached per system instruction so every call reuses the same client
+        # instead of paying connection setup again
+        self._get_model = functools.lru_cache(maxsize=32)(self._build_model)
+
+        # Response cache; semantic (embedding) matching is opt-in via LLM_SEMANTIC_CACHE
+        self.cache = SemanticCache(
+            max_entries=int(os.getenv('LLM_CACHE_SIZE', '256')),
+            semantic=os.getenv('LLM_SEMANTIC_CACHE', 'false').lower() == 'true',
+            threshold=float(os.getenv('LLM_CACHE_THRESHOLD', '0.95')),
+        )
+        # validate_api_key result, reused for validation_ttl seconds
+        self.validation_ttl = int(os.getenv('API_KEY_VALIDATION_TTL', '300'))
+        self._validated_at = 0.0
+        self._validated_result: Optional[bool] = None
+
+        # Exact token counts keyed by content digest, bounded to the most recent prompts
+        self._token_counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._token_count_cache_size = 1024
+        self._token_count_lock = threading.Lock()
 
         if not self.api_key:
             logger.warning("No GOOGLE_API_KEY found in environment variables")
@@ -38,9 +119,10 @@ class LLMHandler:
             except Exception as e:
                 logger.error(f"Failed to configure Google Generative AI client: {e}")
 
-    def call_llm(self, prompt: str, system_message: Optional[str] = None) -> str:
+    def call_llm(self, prompt: str, system_message: Optional[str] = None, cache: bool = True) -> str:
         """
         Make a call to the Gemini model with the given prompt.
+        cache=False skips the response cache (e.g. for generated code, whose failures must not replay).
         """
         if not self.api_key:
             logger.error("Cannot call LLM: No GOOGLE_API_KEY configured")
@@ -48,57 +130,210 @@ class LLMHandler:
 
         # Optionally truncate prompt to keep within budget
         prompt_to_send = self.truncate_prompt(prompt, max_context_tokens=3000)
-
-        generation_config = {
-            "temperature": self.temperature,
-            "max_output_tokens": self.max_tokens,
-        }
+        if cache:
+            cached, cache_token = self.cache.lookup(prompt_to_send, system_message, self.model)
+            if cached is not None:
+                return cached
+        model = self._get_model(system_message)
 
         for attempt in range(self.max_retries):
             try:
+                self.rate_limiter.acquire(self._request_cost(prompt_to_send))
                 logger.info(f"Making LLM API call (attempt {attempt + 1})")
+                response = model.generate_content(
+                    prompt_to_send, generation_config=self.generation_config
+                )
+                result_text = self._extract_text(response)
+                logger.info("LLM API call successful")
+                if cache:
+                    self.cache.store(cache_token, result_text)
+                return result_text
 
-                if system_message:
-                    model = genai.GenerativeModel(
-                        model_name=self.model,
-                        system_instruction=system_message,
-                        generation_config=generation_config,
-                    )
+            except Exception as e:
+                logger.error(f"Error calling Gemini (attempt {attempt + 1}): {str(e)}")
+                if attempt < self.max_retries - 1:
+                    time.sleep(self._backoff_delay(attempt, e))
                 else:
-                    model = genai.GenerativeModel(
-                        model_name=self.model,
-                        generation_config=generation_config,
-                    )
+                    raise
 
-                response = model.generate_content(prompt_to_send)
+        raise Exception("Max retries exceeded for LLM API call")
 
-                # Prefer .text; fallback to candidates
-                result_text = getattr(response, 'text', None)
-                if not result_text and getattr(response, 'candidates', None):
-                    try:
-                        result_text = response.candidates[0].content.parts[0].text
-                    except Exception:
-                        result_text = ""
+    def call_llm_stream(self, prompt: str, system_message: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream the response text chunk by chunk as the model generates it.
+        Stopping iteration early abandons the rest of the generation.
+        """
+        if not self.api_key:
+            logger.error("Cannot call LLM: No GOOGLE_API_KEY configured")
+            raise ValueError("Gemini API key not configured")
+
+        prompt_to_send = self.truncate_prompt(prompt, max_context_tokens=3000)
+        model = self._get_model(system_message)
+        self.rate_limiter.acquire(self._request_cost(prompt_to_send))
+        logger.info("Making streaming LLM API call")
+        response = model.generate_content(
+            prompt_to_send, generation_config=self.generation_config, stream=True
+        )
+        for chunk in response:
+            text = self._chunk_text(chunk)
+            if text:
+                yield text
 
-                result_text = (result_text or "").strip()
+    async def acall_llm(self, prompt: str, system_message: Optional[str] = None,
+                        stop_condition: Optional[Callable[[str], bool]] = None,
+                        response_schema: Optional[Any] = None,
+                        temperature: Optional[float] = None,
+                        max_tokens: Optional[int] = None,
+                        cache: bool = True) -> str:
+        """
+        Async variant of call_llm so independent pipeline stages can overlap their LLM round-trips.
+
+        When stop_condition is given the response is streamed, and generation is abandoned
+        as soon as stop_condition(text_so_far) returns True.
+        When response_schema is given (e.g. a TypedDict) the model is asked for JSON matching it,
+        and the raw JSON text is returned.
+        temperature overrides the configured sampling temperature for this call only,
+        and max_tokens the configured output token limit.
+        cache=False skips the response cache, as for call_llm.
+        """
+        if not self.api_key:
+            logger.error("Cannot call LLM: No GOOGLE_API_KEY configured")
+            raise ValueError("Gemini API key not configured")
+
+        generation_config = self.generation_config
+        cache_namespace = self.model
+        if temperature is not None:
+            generation_config = {**generation_config, "temperature": temperature}
+            # Different temperatures must not share cached answers
+            cache_namespace = f"{cache_namespace}:t={temperature}"
+        if max_tokens is not None:
+            generation_config = {**generation_config, "max_output_tokens": max_tokens}
+            cache_namespace = f"{cache_namespace}:max={max_tokens}"
+        if response_schema is not None:
+            generation_config = {
+                **generation_config,
+                "response_mime_type": "application/json",
+                "response_schema": response_schema,
+            }
+            cache_namespace = f"{cache_namespace}:json:{getattr(response_schema, '__name__', response_schema)}"
+
+        prompt_to_send = await self.atruncate_prompt(prompt, max_context_tokens=3000)
+        if cache:
+            cached, cache_token = await self.cache.alookup(prompt_to_send, system_message, cache_namespace)
+            if cached is not None:
+                return cached
+        model = self._get_model(system_message)
+
+        for attempt in range(self.max_retries):
+            try:
+                await self.rate_limiter.aacquire(self._request_cost(prompt_to_send, max_tokens))
+                logger.info(f"Making async LLM API call (attempt {attempt + 1})")
+                if stop_condition is None:
+                    response = await model.generate_content_async(
+                        prompt_to_send, generation_config=generation_config
+                    )
+                    result_text = self._extract_text(response)
+                else:
+                    result_text = await self._astream_until(
+                        model, prompt_to_send, generation_config, stop_condition
+                    )
                 logger.info("LLM API call successful")
+                if cache:
+                    self.cache.store(cache_token, result_text)
                 return result_text
 
             except Exception as e:
                 logger.error(f"Error calling Gemini (attempt {attempt + 1}): {str(e)}")
                 if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay * (2 ** attempt))
+                    await asyncio.sleep(self._backoff_delay(attempt, e))
                 else:
                     raise
 
         raise Exception("Max retries exceeded for LLM API call")
 
+    def _request_cost(self, prompt: str, max_tokens: Optional[int] = None) -> int:
+        """Tokens to reserve for one request: the prompt plus the maximum completion."""
+        return self.estimate_tokens(prompt) + (max_tokens or self.max_tokens)
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """Honor a server Retry-After when present, otherwise capped exponential backoff with jitter."""
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, 0.5 * retry_after)
+        return min(self.max_retry_delay, self.retry_delay * (2 ** attempt)) + random.uniform(0, self.retry_delay)
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if not headers:
+            return None
+        try:
+            return max(0.0, float(headers.get('Retry-After')))
+        except (TypeError, ValueError):
+            return None
+
+    async def _astream_until(self, model: genai.GenerativeModel, prompt: str,
+                             generation_config: Dict[str, Any],
+                             stop_condition: Callable[[str], bool]) -> str:
+        """Accumulate a streamed response, returning early once stop_condition is met."""
+        buffer = StringIO()
+        response = await model.generate_content_async(
+            prompt, generation_config=generation_config, stream=True
+        )
+        async for chunk in response:
+            text = self._chunk_text(chunk)
+            if not text:
+                continue
+            buffer.write(text)
+            if stop_condition(buffer.getvalue()):
+                logger.info("Stopping LLM stream early: response is complete")
+                break
+        return buffer.getvalue().strip()
+
+    def _build_model(self, system_message: Optional[str] = None) -> genai.GenerativeModel:
+        """Create a GenerativeModel; use the cached _get_model rather than calling this directly."""
+        if system_message:
+            return genai.GenerativeModel(
+                model_name=self.model,
+                system_instruction=system_message,
+                generation_config=self.generation_config,
+            )
+        return genai.GenerativeModel(
+            model_name=self.model,
+            generation_config=self.generation_config,
+        )
+
+    @staticmethod
+    def _extract_text(response: Any) -> str:
+        """Pull the text out of a Gemini response, preferring .text and falling back to candidates."""
+        result_text = getattr(response, 'text', None)
+        if not result_text and getattr(response, 'candidates', None):
+            try:
+                result_text = response.candidates[0].content.parts[0].text
+            except Exception:
+                result_text = ""
+        return (result_text or "").strip()
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        """Text of one streamed chunk; chunks without parts (e.g. the final one) yield ''."""
+        try:
+            return chunk.text or ""
+        except Exception:
+            return ""
+
     def call_llm_with_context(self, prompt: str, context: Dict[str, Any]) -> str:
-        system_message = self._build_system_message(context)
-        return self.call_llm(prompt, system_message)
+        # The system instruction stays constant; per-request context goes after the prompt
+        # so the cacheable prefix is identical across calls
+        context_block = self._build_context_block(context)
+        if context_block:
+            prompt = f"{prompt}\n\n{context_block}"
+        # Generated code is not cached: a failed script would be replayed on retry
+        return self.call_llm(prompt, self._build_system_message(), cache=False)
 
-    def _build_system_message(self, context: Dict[str, Any]) -> str:
-        base_message = """You are an expert data analyst and Python programmer. 
+    def _build_system_message(self) -> str:
+        return """You are an expert data analyst and Python programmer. 
         You help users analyze data by writing precise, executable Python code.
         
         Guidelines:
@@ -109,29 +344,37 @@ class LLMHandler:
         5. Focus on answering the specific questions asked
         """
 
+    def _build_context_block(self, context: Dict[str, Any]) -> str:
+        lines = []
+
         if context.get('data_type'):
-            base_message += f"\n\nData type: {context['data_type']}"
+            lines.append(f"Data type: {context['data_type']}")
 
         if context.get('data_structure'):
-            base_message += f"\nData structure: {context['data_structure']}"
+            lines.append(f"Data structure: {context['data_structure']}")
 
         if context.get('previous_error'):
-            base_message += f"\n\nPrevious error encountered: {context['previous_error']}"
-            base_message += "\nPlease fix the error and ensure the code runs successfully."
+            lines.append(f"\nPrevious error encountered: {context['previous_error']}")
+            lines.append("Please fix the error and ensure the code runs successfully.")
 
-        return base_message
+        return "\n".join(lines)
 
     def validate_api_key(self) -> bool:
         if not self.api_key:
             return False
+        if (self._validated_result is not None
+                and time.monotonic() - self._validated_at < self.validation_ttl):
+            return self._validated_result
         try:
-            model = genai.GenerativeModel(model_name=self.model)
-            resp = model.generate_content("Say 'working' if API key is valid.")
-            text = getattr(resp, 'text', '') or ''
-            return 'working' in text.lower()
+            # Model metadata lookup: authenticates the key without spending a generation request
+            genai.get_model(f"models/{self.model}")
+            result = True
         except Exception as e:
             logger.error(f"API key validation failed: {str(e)}")
-            return False
+            result = False
+        self._validated_result = result
+        self._validated_at = time.monotonic()
+        return result
 
     def get_model_info(self) -> Dict[str, Any]:
         return {
@@ -141,24 +384,99 @@ class LLMHandler:
             "max_retries": self.max_retries,
             "api_key_configured": bool(self.api_key),
             "provider": "google-generativeai",
-            "api_key_valid": self.validate_api_key() if self.api_key else False,
         }
 
     def estimate_tokens(self, text: str) -> int:
         # Rough estimation: 1 token ≈ 4 characters
         return len(text) // 4
 
+    def count_tokens(self, text: str) -> int:
+        """Exact token count from the Gemini tokenizer; falls back to the estimate on failure."""
+        digest = self._token_digest(text)
+        cached = self._get_cached_token_count(digest)
+        if cached is not None:
+            return cached
+        try:
+            total = self._get_model(None).count_tokens(text).total_tokens
+        except Exception as e:
+            logger.warning(f"Token counting failed, using estimate: {str(e)}")
+            return self.estimate_tokens(text)
+        self._store_token_count(digest, total)
+        return total
+
+    async def acount_tokens(self, text: str) -> int:
+        """Async variant of count_tokens."""
+        digest = self._token_digest(text)
+        cached = self._get_cached_token_count(digest)
+        if cached is not None:
+            return cached
+        try:
+            total = (await self._get_model(None).count_tokens_async(text)).total_tokens
+        except Exception as e:
+            logger.warning(f"Token counting failed, using estimate: {str(e)}")
+            return self.estimate_tokens(text)
+        self._store_token_count(digest, total)
+        return total
+
     def truncate_prompt(self, prompt: str, max_context_tokens: int = 3000) -> str:
-        estimated_tokens = self.estimate_tokens(prompt)
-        if estimated_tokens <= max_context_tokens:
-            return prompt
-        target_length = max_context_tokens * 4
-        if len(prompt) <= target_length:
+        token_count = self._local_token_count(prompt, max_context_tokens)
+        if token_count is None:
+            token_count = self.count_tokens(prompt)
+        return self._truncate_to_budget(prompt, token_count, max_context_tokens)
+
+    async def atruncate_prompt(self, prompt: str, max_context_tokens: int = 3000) -> str:
+        """Async variant of truncate_prompt."""
+        token_count = self._local_token_count(prompt, max_context_tokens)
+        if token_count is None:
+            token_count = await self.acount_tokens(prompt)
+        return self._truncate_to_budget(prompt, token_count, max_context_tokens)
+
+    def _local_token_count(self, prompt: str, max_context_tokens: int) -> Optional[int]:
+        """
+        The ~4 chars/token estimate when it clearly settles whether the prompt fits, or None when
+        it is close enough to the budget to be worth a tokenizer round-trip.
+        """
+        # Tokens average well above 3.5 characters for prose, code and JSON metadata alike
+        if len(prompt) <= max_context_tokens * 3.5:
+            return self.estimate_tokens(prompt)
+        estimate = self.estimate_tokens(prompt)
+        if estimate >= max_context_tokens * 1.25:
+            return estimate
+        return None
+
+    def _truncate_to_budget(self, prompt: str, token_count: int, max_context_tokens: int) -> str:
+        """Keep the head and tail of the prompt, sized from its measured characters-per-token."""
+        if token_count <= max_context_tokens:
             return prompt
-        keep_start = target_length // 2
-        keep_end = target_length // 2
-        truncated = (prompt[:keep_start] +
+        chars_per_token = len(prompt) / max(token_count, 1)
+        # Leave a little headroom since the density is not uniform across the prompt
+        target_length = int(max_context_tokens * chars_per_token * 0.95)
+        keep = target_length // 2
+        # Cut on whitespace so no token is split in half
+        start_cut = prompt.rfind(' ', 0, keep)
+        start_cut = start_cut if start_cut > keep // 2 else keep
+        end_cut = prompt.find(' ', len(prompt) - keep)
+        end_cut = end_cut if 0 <= end_cut < len(prompt) - keep // 2 else len(prompt) - keep
+        truncated = (prompt[:start_cut] +
                      "\n\n... [TRUNCATED FOR LENGTH] ...\n\n" +
-                     prompt[-keep_end:])
-        logger.warning(f"Prompt truncated from {len(prompt)} to {len(truncated)} characters")
-        return truncated
\ No newline at end of file
+                     prompt[end_cut:])
+        logger.warning(f"Prompt truncated from {token_count} tokens ({len(prompt)} characters) "
+                       f"to {len(truncated)} characters")
+        return truncated
+
+    @staticmethod
+    def _token_digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def _get_cached_token_count(self, digest: bytes) -> Optional[int]:
+        with self._token_count_lock:
+            total = self._token_counts.get(digest)
+            if total is not None:
+                self._token_counts.move_to_end(digest)
+            return total
+
+    def _store_token_count(self, digest: bytes, total: int) -> None:
+        with self._token_count_lock:
+            self._token_counts[digest] = total
+            while len(self._token_counts) > self._token_count_cache_size:
+                self._token_counts.popitem(last=False)
@@ -4,8 +4,12 @@ Entry point that runs the web server and defines API endpoints.
 """
 
 from flask import Flask, request, jsonify
+from flask_compress import Compress
 import os
+import asyncio
 import logging
+import tempfile
+import threading
 from orchestrator import Orchestrator
 
 # Configure logging
@@ -15,14 +19,44 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Uploads larger than this are spooled to a temp file and passed by path instead of held in memory
+SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', 1024 * 1024))
+
+# Compress JSON responses for clients that accept gzip
+Compress(app)
+
 # Initialize orchestrator
 orchestrator = Orchestrator()
 
+# One event loop per worker process, run on a background thread. The Gemini SDK caches its async
+# client on the loop that first used it, so a fresh loop per request (as Flask's async views use)
+# would break every request after the first. Every request in the worker shares this loop, so
+# pipeline coroutines must hand blocking IO or CPU-heavy steps to asyncio.to_thread
+_pipeline_loop = None
+_pipeline_loop_lock = threading.Lock()
+
+def _run_pipeline(coro):
+    """Run a coroutine on the process-wide pipeline loop and wait for its result."""
+    global _pipeline_loop
+    with _pipeline_loop_lock:
+        # Started lazily so it is created after gunicorn forks the worker
+        if _pipeline_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='pipeline-loop', daemon=True).start()
+            _pipeline_loop = loop
+    return asyncio.run_coroutine_threadsafe(coro, _pipeline_loop).result()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "service": "llm-agent-project"})
 
+@app.route('/validate', methods=['GET'])
+def validate_api_key():
+    """Check that the configured Gemini API key works (result cached for a few minutes)"""
+    valid = orchestrator.llm_handler.validate_api_key()
+    return jsonify({"api_key_valid": valid, **orchestrator.llm_handler.get_model_info()}), (200 if valid else 503)
+
 @app.route('/api', methods=['POST'])
 @app.route('/api/', methods=['POST'])
 def analyze_data():
@@ -30,7 +64,9 @@ def analyze_data():
     Main API endpoint for data analysis.
     Accepts questions file and optional data attachments.
     Returns analysis results in JSON format.
+    The pipeline runs on the shared event loop so it can overlap its LLM calls.
     """
+    data_files = []
     try:
         # Validate request: support 'questions' or 'questions.txt' as the field name
         questions_key = 'questions' if 'questions' in request.files else (
@@ -47,15 +83,10 @@ def analyze_data():
         questions_content = questions_file.read().decode('utf-8')
         
         # Get optional data attachments
-        data_files = []
-        for key in request.files:
-            if key != questions_key:
-                data_file = request.files[key]
-                if data_file.filename:
-                    data_files.append({
-                        'filename': data_file.filename,
-                        'content': data_file.read()
-                    })
+        for key, data_file in request.files.items():
+            if key == questions_key or not data_file.filename:
+                continue
+            data_files.append(_read_upload(data_file))
         
         # Get optional URL parameter
         data_url = request.form.get('url', '')
@@ -63,23 +94,45 @@ def analyze_data():
         logger.info(f"Processing analysis request with {len(data_files)} data files and URL: {data_url}")
         
         # Process through orchestrator
-        result = orchestrator.process_request(
+        result = _run_pipeline(orchestrator.process_request(
             questions=questions_content,
             data_files=data_files,
             data_url=data_url
-        )
+        ))
         
         return jsonify(result)
         
     except Exception as e:
         logger.error(f"Error processing request: {str(e)}")
         return jsonify({"error": f"Internal server error: {str(e)}"}), 500
+    finally:
+        for file_info in data_files:
+            if 'path' in file_info:
+                try:
+                    os.remove(file_info['path'])
+                except OSError:
+                    pass
+
+def _read_upload(data_file) -> dict:
+    """Keep small uploads in memory; spool large ones to disk so the reader can mmap them."""
+    stream = data_file.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size <= SPOOL_THRESHOLD:
+        return {'filename': data_file.filename, 'content': stream.read()}
+    
+    suffix = os.path.splitext(data_file.filename)[1]
+    with tempfile.NamedTemporaryFile(prefix='upload_', suffix=suffix, delete=False) as tmp:
+        data_file.save(tmp)
+    return {'filename': data_file.filename, 'path': tmp.name}
 
 @app.errorhandler(413)
 def too_large(e):
     return jsonify({"error": "File too large. Maximum size is 16MB"}), 413
 
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see gunicorn.conf.py)
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('DEBUG', 'False').lower() == 'true'
     
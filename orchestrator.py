@@ -4,26 +4,132 @@ Coordinates between different modules to process user requests.
 """
 
 import os
-import json
+import re
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Any, Optional
+import tempfile
+from typing import List, Dict, Any, Optional, Tuple
+from typing_extensions import TypedDict
 from llm_handler import LLMHandler
 from tool_executor import ToolExecutor
 from code_executor import CodeExecutor
 from string import Template
 
+import orjson
+import pandas as pd
+import pyarrow as pa
+from diskcache import Cache
+
 logger = logging.getLogger(__name__)
 
+# Non-string keys (e.g. numeric Excel headers) and NumPy scalars both occur in tool output
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# A closed ```python (or bare ```) block; once streamed output contains one, the code is complete
+_FENCED_CODE_RE = re.compile(r"```(?:python|py)?\n[\s\S]*?```", re.IGNORECASE)
+_URL_RE = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+')
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*\n([\s\S]*?)```", re.IGNORECASE)
+
+# Sampling temperatures for parallel correction candidates, chosen for diversity
+_CORRECTION_TEMPERATURES = (0.3, 0.7, 0.9)
+
+_PROMPT_TEMPLATE_NAMES = ("1_task_breakdown", "2_code_generation", "3_code_correction")
+
+
+def _orjson_default(obj: Any) -> Any:
+    """orjson fallback: materialize tables the data reader keeps lazily as records, stringify the rest."""
+    if isinstance(obj, pa.Table):
+        return obj.to_pylist()
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict('records')
+    return str(obj)
+
+
+def _iter_balanced(text: str, opener: str):
+    """Yield each top-level balanced {...} or [...] span in text, ignoring brackets inside JSON strings."""
+    closer = '}' if opener == '{' else ']'
+    start = text.find(opener)
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        end = -1
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == '\\':
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == opener:
+                depth += 1
+            elif ch == closer:
+                depth -= 1
+                if depth == 0:
+                    end = i
+                    break
+        if end == -1:
+            return
+        yield text[start:end + 1]
+        start = text.find(opener, end + 1)
+
+
+def _extract_json(text: str, expected_type: type, last: bool = False) -> Any:
+    """
+    Leniently pull a JSON value of expected_type (dict or list) out of LLM or script output.
+    Tries the whole text, then a ```json fence, then each balanced {...}/[...] span
+    (the first match, or the last one when last=True). Returns None if nothing parses.
+    """
+    if not text:
+        return None
+
+    candidates = [text.strip()]
+    fence = _JSON_FENCE_RE.search(text)
+    if fence:
+        candidates.append(fence.group(1).strip())
+    for candidate in candidates:
+        try:
+            value = orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(value, expected_type):
+            return value
+
+    found = None
+    for span in _iter_balanced(text, '{' if expected_type is dict else '['):
+        try:
+            value = orjson.loads(span)
+        except orjson.JSONDecodeError:
+            continue
+        if isinstance(value, expected_type):
+            if not last:
+                return value
+            found = value
+    return found
+
+
+# typing.TypedDict is rejected by genai's schema conversion before Python 3.12
+class CodePlan(TypedDict):
+    """Structured response schema for the combined planning + code generation call."""
+    plan: str
+    steps: List[str]
+    code: str
+
+
 class Orchestrator:
     """
     Central controller that manages the sequence of operations:
     1. Initial analysis and triage
-    2. Task breakdown
-    3. Data sourcing
-    4. Metadata extraction
-    5. Code generation
-    6. Local execution and correction loop
-    7. Final output generation
+    2. Data sourcing
+    3. Metadata extraction
+    4. Task breakdown and code generation (one structured LLM call)
+    5. Local execution and correction loop
+    6. Final output generation
     """
     
     def __init__(self):
@@ -31,14 +137,25 @@ class Orchestrator:
         self.tool_executor = ToolExecutor()
         self.code_executor = CodeExecutor()
         self.max_correction_attempts = 3
+        # LLM corrections raced per correction round; 1 restores strictly serial retries
+        self.speculative_corrections = int(os.getenv('SPECULATIVE_CORRECTIONS', '3'))
+        # The plan + code JSON reply carries the plan, the steps and the JSON-escaped script
+        self.code_max_tokens = int(os.getenv('CODE_MAX_TOKENS', '4096'))
+        # Prompt files are read and parsed once per process, not once per LLM call
+        self._templates = {
+            name: Template(self._load_prompt_template(name)) for name in _PROMPT_TEMPLATE_NAMES
+        }
+        # Finished results for identical requests; on disk so all server workers share it
+        self.result_cache_ttl = int(os.getenv('RESULT_CACHE_TTL', '3600'))
+        self.result_cache = Cache(os.getenv('RESULT_CACHE_DIR', os.path.join('.cache', 'results')))
     
-    def process_request(self, questions: str, data_files: List[Dict], data_url: str = "") -> Dict[str, Any]:
+    async def process_request(self, questions: str, data_files: List[Dict], data_url: str = "") -> Dict[str, Any]:
         """
         Main processing pipeline for incoming requests.
         
         Args:
             questions: User's questions as text
-            data_files: List of uploaded files with filename and content
+            data_files: List of uploaded files with filename and either content or path
             data_url: Optional URL for data source
             
         Returns:
@@ -47,6 +164,15 @@ class Orchestrator:
         try:
             logger.info("Starting request processing pipeline")
             
+            # Hashing reads every upload, so only do it when the cache is on
+            cache_key = None
+            if self.result_cache_ttl > 0:
+                cache_key = await asyncio.to_thread(self._request_cache_key, questions, data_files, data_url)
+                cached = await asyncio.to_thread(self.result_cache.get, cache_key)
+                if cached is not None:
+                    logger.info("Returning cached result for identical request")
+                    return cached
+            
             # Step 1: Request reception and triage
             data_source_type = self._analyze_data_source(questions, data_files, data_url)
             logger.info(f"Identified data source type: {data_source_type}")
@@ -58,30 +184,37 @@ class Orchestrator:
                     data_url = extracted_url
                     logger.info(f"Extracted URL from questions: {data_url}")
             
-            # Step 2: Task breakdown
-            task_plan = self._get_task_breakdown(questions)
-            logger.info("Generated task breakdown plan")
-            
-            # Step 3: Data sourcing
-            raw_data = self._source_data(data_source_type, data_files, data_url, task_plan)
+            # Step 2: Data sourcing. The plan is produced together with the code in step 4,
+            # so a standalone task breakdown is only needed to recover a URL from it.
+            task_plan: Dict[str, Any] = {}
+            if data_source_type == "url_in_text" and not data_url:
+                task_plan = await self._get_task_breakdown(questions)
+                logger.info("Generated task breakdown plan")
+            raw_data = await self._source_data(data_source_type, data_files, data_url, task_plan)
             logger.info("Data sourcing completed")
             
-            # Step 4: Metadata extraction
-            metadata = self._extract_metadata(raw_data, data_source_type)
+            # Step 3: Metadata extraction
+            metadata = await self._extract_metadata(raw_data, data_source_type)
             logger.info("Metadata extraction completed")
             
-            # Step 5: Code generation
-            generated_code = self._generate_code(questions, metadata)
-            logger.info("Code generation completed")
+            # Step 4: Task breakdown and code generation
+            code_plan = await self._generate_code(questions, metadata)
+            logger.info(f"Code generation completed ({len(code_plan['steps'])} planned steps)")
             
-            # Step 6: Local execution and correction loop
-            execution_result = self._execute_with_correction(generated_code, raw_data)
+            # Step 5: Local execution and correction loop
+            execution_result = await self._execute_with_correction(code_plan["code"], raw_data)
             logger.info("Code execution completed")
             
-            # Step 7: Final output generation
-            final_output = self._format_final_output(execution_result, questions)
+            # Step 6: Final output generation
+            # Scanning a long stdout for the JSON answer is CPU-bound
+            final_output = await asyncio.to_thread(self._format_final_output, execution_result, questions)
             logger.info("Request processing completed successfully")
             
+            if cache_key is not None and execution_result["success"]:
+                await asyncio.to_thread(
+                    self.result_cache.set, cache_key, final_output, expire=self.result_cache_ttl
+                )
+            
             return final_output
             
         except Exception as e:
@@ -92,6 +225,30 @@ class Orchestrator:
                 "results": []
             }
     
+    @staticmethod
+    def _request_cache_key(questions: str, data_files: List[Dict], data_url: str) -> str:
+        """Content hash of everything that determines a request's result."""
+        digest = hashlib.blake2b(digest_size=32)
+
+        def update(part: bytes) -> None:
+            # Length-prefix each part so different splits of the same bytes hash differently
+            digest.update(len(part).to_bytes(8, 'little'))
+            digest.update(part)
+
+        update(questions.encode('utf-8'))
+        update((data_url or '').encode('utf-8'))
+        for file_info in data_files:
+            update(file_info['filename'].encode('utf-8'))
+            if 'path' in file_info:
+                # Large uploads are spooled to disk; hash them in chunks rather than loading them
+                digest.update(os.path.getsize(file_info['path']).to_bytes(8, 'little'))
+                with open(file_info['path'], 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+            else:
+                update(file_info['content'])
+        return digest.hexdigest()
+    
     def _analyze_data_source(self, questions: str, data_files: List[Dict], data_url: str) -> str:
         """Determine the nature of the data source."""
         if data_url and data_url.strip():
@@ -103,23 +260,21 @@ class Orchestrator:
         else:
             return "text_only"
     
-    def _get_task_breakdown(self, questions: str) -> Dict[str, Any]:
+    async def _get_task_breakdown(self, questions: str) -> Dict[str, Any]:
         """Get structured task breakdown from LLM."""
-        prompt_template = self._load_prompt_template("1_task_breakdown")
-        prompt = Template(prompt_template).safe_substitute(questions=questions)
+        prompt = self._templates["1_task_breakdown"].safe_substitute(questions=questions)
         
-        response = self.llm_handler.call_llm(prompt)
+        response = await self.llm_handler.acall_llm(prompt)
         
-        try:
-            # Try to parse as JSON, fallback to text plan
-            task_plan = json.loads(response)
-        except json.JSONDecodeError:
+        # Models often wrap the JSON in a fence or prose; fall back to a text plan only if none parses
+        task_plan = _extract_json(response, dict)
+        if task_plan is None:
             task_plan = {"plan": response, "steps": []}
         
         return task_plan
     
-    def _source_data(self, data_source_type: str, data_files: List[Dict], 
-                     data_url: str, task_plan: Dict[str, Any]) -> Any:
+    async def _source_data(self, data_source_type: str, data_files: List[Dict], 
+                           data_url: str, task_plan: Dict[str, Any]) -> Any:
         """Source data based on the identified type and task plan."""
         if data_source_type == "url" or data_source_type == "url_in_text":
             # Extract URL if it's in text
@@ -127,132 +282,217 @@ class Orchestrator:
                 # Fallback: try extracting from the task plan if URL not already found
                 data_url = self._extract_url_from_text(task_plan.get("plan", ""))
             
-            return self.tool_executor.execute_tool("web_scraper", {"url": data_url})
+            return await asyncio.to_thread(
+                self.tool_executor.execute_tool, "web_scraper", {"url": data_url}
+            )
         
         elif data_source_type == "file":
-            # Process uploaded files
-            processed_files = []
-            for file_info in data_files:
-                processed_data = self.tool_executor.execute_tool("data_reader", {
-                    "filename": file_info["filename"],
-                    "content": file_info["content"]
-                })
-                processed_files.append(processed_data)
-            return processed_files
+            # Process uploaded files concurrently; results keep the upload order
+            # Each entry carries either in-memory 'content' or the 'path' of a spooled upload
+            return list(await asyncio.gather(*(
+                asyncio.to_thread(self.tool_executor.execute_tool, "data_reader", file_info)
+                for file_info in data_files
+            )))
         
         else:
             # Text-only analysis
             return {"type": "text", "content": ""}
     
-    def _extract_metadata(self, raw_data: Any, data_source_type: str) -> Dict[str, Any]:
+    async def _extract_metadata(self, raw_data: Any, data_source_type: str) -> Dict[str, Any]:
         """Extract compact metadata from raw data."""
-        return self.tool_executor.execute_tool("data_inspector", {
+        return await asyncio.to_thread(self.tool_executor.execute_tool, "data_inspector", {
             "data": raw_data,
             "source_type": data_source_type
         })
     
-    def _generate_code(self, questions: str, metadata: Dict[str, Any]) -> str:
-        """Generate Python code based on questions and metadata."""
-        prompt_template = self._load_prompt_template("2_code_generation")
-        prompt = Template(prompt_template).safe_substitute(
+    async def _generate_code(self, questions: str, metadata: Dict[str, Any]) -> CodePlan:
+        """Plan the analysis and generate Python code for it in a single JSON-mode LLM call."""
+        prompt = self._templates["2_code_generation"].safe_substitute(
             questions=questions,
-            metadata=json.dumps(metadata, indent=2)
+            # Compact JSON: indentation only costs prompt tokens
+            metadata=orjson.dumps(metadata, default=_orjson_default, option=_ORJSON_OPTIONS).decode('utf-8')
         )
         
-        return self.llm_handler.call_llm(prompt)
+        response = await self.llm_handler.acall_llm(
+            prompt, response_schema=CodePlan, max_tokens=self.code_max_tokens,
+            # A cached plan would replay the same broken code when a failed request is retried
+            cache=False
+        )
+        
+        parsed = _extract_json(response, dict)
+        if not parsed or not parsed.get("code"):
+            # Usually a reply truncated mid-JSON; its text is not runnable code either
+            logger.error("Code generation response was not a valid JSON plan")
+            raise ValueError("Code generation returned an incomplete or invalid JSON plan")
+        
+        steps = parsed.get("steps")
+        return {
+            "plan": str(parsed.get("plan", "")),
+            "steps": steps if isinstance(steps, list) else [],
+            "code": str(parsed["code"]),
+        }
     
-    def _execute_with_correction(self, code: str, raw_data: Any = None) -> Dict[str, Any]:
+    async def _execute_with_correction(self, code: str, raw_data: Any = None) -> Dict[str, Any]:
         """Execute code with correction loop if needed."""
-        attempts = 0
-        current_code = code
-
-        # Inject data into the code if provided
-        if raw_data is not None:
-            data_json = json.dumps(raw_data, default=str)
-            # Provide metadata as a Python object parsed from JSON when raw_data is a dict; otherwise None
-            metadata_json = json.dumps(raw_data, default=str) if isinstance(raw_data, dict) else 'null'
-            data_injection = f"""
+        if raw_data is None:
+            return await self._run_correction_loop(code, "")
+
+        # Serialize the data once to a sidecar file that the script loads at startup,
+        # instead of splicing it into the source (which also kept it out of correction prompts)
+        data_path = await asyncio.to_thread(self._write_data_payload, raw_data)
+        try:
+            return await self._run_correction_loop(code, self._build_data_injection(data_path))
+        finally:
+            try:
+                os.remove(data_path)
+            except OSError:
+                pass
+
+    def _write_data_payload(self, raw_data: Any) -> str:
+        """Write raw_data as JSON to a temp file in the executor's output directory."""
+        payload = orjson.dumps(raw_data, default=_orjson_default, option=_ORJSON_OPTIONS)
+        with tempfile.NamedTemporaryFile(
+            'wb', suffix='.json', prefix='data_', dir=self.code_executor.output_dir, delete=False
+        ) as f:
+            f.write(payload)
+            return f.name
+
+    @staticmethod
+    def _build_data_injection(data_path: str) -> str:
+        """Preamble that loads the data payload; metadata is the same object when it is a dict."""
+        return f"""
 # Data injection
 import json
-data = json.loads(r'''{data_json}''')
-metadata = json.loads(r'''{metadata_json}''')
+import orjson
+with open({os.path.abspath(data_path)!r}, 'rb') as _data_file:
+    data = orjson.loads(_data_file.read())
+metadata = data if isinstance(data, dict) else None
 
 # User code starts here
 """
-            current_code = data_injection + current_code
 
-        while attempts < self.max_correction_attempts:
-            try:
-                # Pre-clean code and validate syntax before attempting to run
-                current_code = self.code_executor.prepare_code(current_code)
-                syntax_check = self.code_executor.validate_code_syntax(current_code)
-                if not syntax_check.get("valid", False):
-                    attempts += 1
-                    logger.warning(
-                        f"Code syntax invalid, attempt {attempts}: {syntax_check.get('error','Invalid code')}"
-                    )
-                    if attempts < self.max_correction_attempts:
-                        current_code = self._correct_code(
-                            current_code,
-                            syntax_check.get("error", "Invalid Python code. Return only Python code."),
-                        )
-                        continue
-                    else:
-                        return {"success": False, "error": syntax_check.get("error", "Invalid code"), "output": ""}
-
-                # Execute only when syntax is valid
-                result = self.code_executor.execute_code(current_code)
+    async def _run_correction_loop(self, code: str, data_injection: str) -> Dict[str, Any]:
+        """Validate, execute and (on failure) correct code; data_injection is prepended only at execution."""
+        attempts = 0
+        result, current_code = await self._attempt_code(code, data_injection)
+
+        while not result["success"]:
+            attempts += 1
+            logger.warning(f"Code attempt {attempts} failed: {result['error']}")
+            if attempts >= self.max_correction_attempts:
+                return result
+
+            # Cheap local fixes first; only fall back to LLM corrections when none applies
+            fixed = self.code_executor.apply_local_fixes(current_code, result["error"])
+            if fixed is not None:
+                logger.info("Applied local code fix, skipping LLM correction")
+                result, current_code = await self._attempt_code(fixed, data_injection)
+            else:
+                result, current_code = await self._race_corrections(
+                    current_code, result["error"], data_injection
+                )
+
+        return result
+
+    async def _attempt_code(self, code: str, data_injection: str) -> Tuple[Dict[str, Any], str]:
+        """Prepare, syntax-check and execute one candidate off the shared event loop."""
+        return await asyncio.to_thread(self._attempt_code_sync, code, data_injection)
+
+    def _attempt_code_sync(self, code: str, data_injection: str) -> Tuple[Dict[str, Any], str]:
+        """Blocking body of _attempt_code; returns the result and the prepared code."""
+        try:
+            # Pre-clean code and validate syntax before attempting to run
+            prepared = self.code_executor.prepare_code(code)
+            syntax_check = self.code_executor.validate_code_syntax(prepared)
+            if not syntax_check.get("valid", False):
+                error = syntax_check.get("error") or "Invalid Python code. Return only Python code."
+                return {"success": False, "error": error, "output": ""}, prepared
+
+            # Execute only when syntax is valid
+            # The code was prepared and syntax-checked in-process above, so
+            # the executor only has to write it out and spawn the interpreter
+            result = self.code_executor.execute_code(data_injection + prepared, prepared=True)
+            return result, prepared
+        except Exception as e:
+            logger.error(f"Execution error: {str(e)}")
+            return {"success": False, "error": str(e), "output": ""}, code
+
+    async def _race_corrections(self, faulty_code: str, error_message: str,
+                                data_injection: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Request several LLM corrections at different temperatures in parallel, then execute them
+        one at a time in arrival order while the rest are still generating. The first one that
+        runs successfully wins and the pending requests are cancelled; if none succeeds, the first
+        failure is returned for the next correction round.
+        Execution stays sequential: a running script cannot be cancelled, and concurrent
+        candidates would share the output directory and the data file.
+        """
+        if self.speculative_corrections <= 1:
+            corrected = await self._correct_code(faulty_code, error_message)
+            return await self._attempt_code(corrected, data_injection)
+
+        temperatures = [
+            _CORRECTION_TEMPERATURES[i % len(_CORRECTION_TEMPERATURES)]
+            for i in range(self.speculative_corrections)
+        ]
+        tasks = [
+            asyncio.create_task(self._correct_code(faulty_code, error_message, t))
+            for t in temperatures
+        ]
+        first_failure = None
+        last_error: Optional[Exception] = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    corrected = await next_done
+                except Exception as e:
+                    logger.error(f"Correction candidate failed: {str(e)}")
+                    last_error = e
+                    continue
+                result, code = await self._attempt_code(corrected, data_injection)
                 if result["success"]:
-                    return result
-                else:
-                    # Attempt correction on runtime error
-                    attempts += 1
-                    logger.warning(f"Code execution failed, attempt {attempts}: {result['error']}")
-                    if attempts < self.max_correction_attempts:
-                        current_code = self._correct_code(current_code, result["error"])
-                    else:
-                        return result
-
-            except Exception as e:
-                attempts += 1
-                logger.error(f"Execution error, attempt {attempts}: {str(e)}")
-                if attempts < self.max_correction_attempts:
-                    current_code = self._correct_code(current_code, str(e))
-                else:
-                    return {"success": False, "error": str(e), "output": ""}
-
-        return {"success": False, "error": "Max correction attempts exceeded", "output": ""}
-    
-    def _correct_code(self, faulty_code: str, error_message: str) -> str:
+                    logger.info("Speculative correction succeeded, cancelling remaining candidates")
+                    return result, code
+                if first_failure is None:
+                    first_failure = (result, code)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if first_failure is None:
+            raise last_error or Exception("All correction candidates failed")
+        return first_failure
+
+    async def _correct_code(self, faulty_code: str, error_message: str,
+                            temperature: Optional[float] = None) -> str:
         """Use LLM to correct faulty code."""
-        prompt_template = self._load_prompt_template("3_code_correction")
-        prompt = Template(prompt_template).safe_substitute(
+        prompt = self._templates["3_code_correction"].safe_substitute(
             code=faulty_code,
             error=error_message
         )
         
-        return self.llm_handler.call_llm(prompt)
+        return await self.llm_handler.acall_llm(
+            prompt, stop_condition=self._has_complete_code_block, temperature=temperature, cache=False
+        )
+
+    @staticmethod
+    def _has_complete_code_block(text: str) -> bool:
+        """
+        True once streamed LLM output contains a closed code fence.
+        prepare_code only keeps the first fenced block, so anything after it is wasted generation.
+        Unfenced output is read to the end, since a prefix of valid code usually parses too.
+        """
+        return text.count("```") >= 2 and _FENCED_CODE_RE.search(text) is not None
     
     def _format_final_output(self, execution_result: Dict[str, Any], 
                            original_questions: str):
         """Format the final output into required JSON structure."""
         if execution_result["success"]:
-            # Try to parse output as JSON array, fallback to string
+            # Try to parse output as JSON array, fallback to string.
+            # The required answer is the last thing printed, so prefer the last array found
             output = execution_result["output"]
-            try:
-                # Look for JSON array pattern in the output
-                import re
-                json_match = re.search(r'\[.*\]', output, re.DOTALL)
-                if json_match:
-                    parsed_results = json.loads(json_match.group())
-                    if isinstance(parsed_results, list):
-                        results = parsed_results
-                    else:
-                        results = [output]
-                else:
-                    results = [output]
-            except (json.JSONDecodeError, ValueError):
-                results = [output]
+            parsed_results = _extract_json(output, list, last=True)
+            results = parsed_results if parsed_results is not None else [output]
 
             # If the instructions ask for a JSON array response, return the array directly
             if 'json array' in original_questions.lower():
@@ -290,45 +530,53 @@ metadata = json.loads(r'''{metadata_json}''')
     
     def _get_default_prompt(self, template_name: str) -> str:
         """Provide default prompts if templates are missing."""
+        # Static instructions come first and per-request values last, so repeated
+        # calls share an identical prefix that the provider's prompt cache can reuse
         defaults = {
             "1_task_breakdown": """
-            Analyze the following questions and create a structured plan to answer them:
-            
-            Questions: {questions}
+            Analyze the questions given at the end and create a structured plan to answer them.
             
             Please provide a step-by-step plan in JSON format with the following structure:
-            {{
+            {
                 "plan": "Brief description of the overall approach",
                 "steps": ["Step 1", "Step 2", "Step 3", ...]
-            }}
+            }
+            
+            ---
+            Questions: $questions
             """,
             "2_code_generation": """
-            Based on the following questions and data metadata, write Python code to perform the analysis:
-            
-            Questions: {questions}
-            
-            Data Metadata: {metadata}
+            Based on the questions and data metadata given at the end, plan the analysis and write Python code to perform it.
             
             Please write clean, executable Python code that answers the questions using the provided data structure.
             Include all necessary imports and ensure the code is self-contained.
+            
+            Respond with a JSON object with the following structure:
+            {
+                "plan": "Brief description of the overall approach",
+                "steps": ["Step 1", "Step 2", "Step 3", ...],
+                "code": "The complete Python script"
+            }
+            
+            ---
+            Questions: $questions
+            
+            Data Metadata: $metadata
             """,
             "3_code_correction": """
-            The following Python code has an error. Please fix it:
+            The Python code given at the end has an error. Please fix it and provide the corrected version of the code.
             
+            ---
             Code:
-            {code}
+            $code
             
             Error:
-            {error}
-            
-            Please provide the corrected version of the code.
+            $error
             """
         }
         return defaults.get(template_name, "")
     
     def _extract_url_from_text(self, text: str) -> str:
         """Extract URL from text content."""
-        import re
-        url_pattern = r'https?://[^\s<>"{{}}|\\^`\[\]]+'
-        urls = re.findall(url_pattern, text)
-        return urls[0] if urls else ""
\ No newline at end of file
+        match = _URL_RE.search(text)
+        return match.group() if match else ""
\ No newline at end of file
@@ -3,9 +3,16 @@ Tool Executor module - Dispatcher for calling appropriate pre-written local tool
 Acts as a dispatcher to call specific tools based on orchestrator instructions.
 """
 
+import io
+import os
+import asyncio
+import mmap
 import logging
-import importlib
+import functools
+import itertools
 from typing import Dict, Any, Optional
+
+import orjson
 from tools import web_scraper, data_inspector
 
 logger = logging.getLogger(__name__)
@@ -23,6 +30,13 @@ class ToolExecutor:
             'data_inspector': data_inspector,
             'data_reader': self  # Built-in data reading functionality
         }
+        # Tool name -> handler, so execute_tool dispatches with one dict lookup.
+        # New tools must register a callable here
+        self._dispatch = {
+            'web_scraper': self._execute_web_scraper,
+            'data_inspector': self._execute_data_inspector,
+            'data_reader': self._execute_data_reader
+        }
         logger.info(f"ToolExecutor initialized with tools: {list(self.available_tools.keys())}")
     
     def execute_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Any:
@@ -36,37 +50,31 @@ class ToolExecutor:
         Returns:
             Result from tool execution
         """
-        logger.info(f"Executing tool: {tool_name} with parameters: {list(parameters.keys())}")
+        # %-style so the message is only formatted when INFO is enabled
+        logger.info("Executing tool: %s with %d parameters", tool_name, len(parameters))
         
-        if tool_name not in self.available_tools:
+        handler = self._dispatch.get(tool_name)
+        if handler is None:
             raise ValueError(f"Tool '{tool_name}' not found. Available tools: {list(self.available_tools.keys())}")
         
         try:
-            if tool_name == 'web_scraper':
-                return self._execute_web_scraper(parameters)
-            elif tool_name == 'data_inspector':
-                return self._execute_data_inspector(parameters)
-            elif tool_name == 'data_reader':
-                return self._execute_data_reader(parameters)
-            else:
-                # Generic tool execution
-                tool_module = self.available_tools[tool_name]
-                if hasattr(tool_module, 'execute'):
-                    return tool_module.execute(parameters)
-                else:
-                    raise AttributeError(f"Tool '{tool_name}' does not have an 'execute' method")
-                    
+            return handler(parameters)
         except Exception as e:
             logger.error(f"Error executing tool '{tool_name}': {str(e)}")
             raise
     
-    def _execute_web_scraper(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute web scraper tool."""
+    def _execute_web_scraper(self, parameters: Dict[str, Any]) -> Any:
+        """Execute web scraper tool; a 'urls' list is fetched concurrently and returns a list of results."""
+        urls = parameters.get('urls')
+        if urls:
+            # execute_tool runs in a worker thread, so the batch can drive its own event loop
+            return asyncio.run(web_scraper.scrape_urls(urls))
+        
         url = parameters.get('url')
         if not url:
             raise ValueError("URL parameter is required for web scraper")
         
-        return web_scraper.scrape_url(url)
+        return web_scraper.scrape_url(url, bypass_cache=bool(parameters.get('bypass_cache', False)))
     
     def _execute_data_inspector(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Execute data inspector tool."""
@@ -81,61 +89,77 @@ class ToolExecutor:
     def _execute_data_reader(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """Built-in data reader for uploaded files."""
         filename = parameters.get('filename', '')
-        content = parameters.get('content')
+        path = parameters.get('path')
         
+        if path:
+            # Spooled upload: tabular parsers read the path themselves, the rest parse from a
+            # read-only mapping instead of a copy in memory
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return self._process_file_content(filename, b'', filepath=path)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    return self._process_file_content(filename, content, filepath=path)
+        
+        content = parameters.get('content')
         if content is None:
-            raise ValueError("Content parameter is required for data reader")
+            raise ValueError("Content or path parameter is required for data reader")
         
         return self._process_file_content(filename, content)
     
-    def _process_file_content(self, filename: str, content: bytes) -> Dict[str, Any]:
+    def _process_file_content(self, filename: str, content: Any,
+                              filepath: Optional[str] = None) -> Dict[str, Any]:
         """
         Process uploaded file content based on file type.
         
         Args:
             filename: Name of the uploaded file
-            content: Raw content of the file
+            content: Raw content of the file (bytes or a read-only mmap)
+            filepath: Path of the same content on disk, if any; CSV and Excel are read from it directly
             
         Returns:
             Processed data with metadata
         """
         import pandas as pd
-        import io
-        import json
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
         from pathlib import Path
         
         file_ext = Path(filename).suffix.lower()
         
         try:
             if file_ext == '.csv':
-                # Process CSV file
-                text_content = content.decode('utf-8')
-                df = pd.read_csv(io.StringIO(text_content))
+                # Process CSV file with Arrow's multithreaded reader, memory-mapping the file when
+                # there is one and otherwise reading the raw bytes in place
+                source = pa.memory_map(filepath) if filepath else pa.BufferReader(pa.py_buffer(content))
+                try:
+                    table = pa_csv.read_csv(source)
+                except pa.ArrowInvalid as e:
+                    # Arrow rejects ragged rows and some quoting; pandas' C parser is more forgiving
+                    logger.warning(f"Arrow could not parse {filename}, falling back to pandas: {str(e)}")
+                    df = pd.read_csv(self._binary_source(content, filepath), encoding='utf-8', engine='c')
+                    return self._dataframe_payload('csv', filename, df)
                 return {
                     'type': 'csv',
                     'filename': filename,
-                    'data': df.to_dict('records'),
-                    'columns': list(df.columns),
-                    'shape': [int(df.shape[0]), int(df.shape[1])],
-                    'dtypes': {str(k): str(v) for k, v in df.dtypes.to_dict().items()}
+                    # Full rows stay in Arrow; only the preview is materialized as Python objects
+                    'data': table,
+                    'sample_data': table.slice(0, 5).to_pylist(),
+                    'columns': table.schema.names,
+                    'shape': [table.num_rows, table.num_columns],
+                    'dtypes': {field.name: str(field.type) for field in table.schema}
                 }
             
             elif file_ext in ['.xlsx', '.xls']:
-                # Process Excel file
-                df = pd.read_excel(io.BytesIO(content))
-                return {
-                    'type': 'excel',
-                    'filename': filename,
-                    'data': df.to_dict('records'),
-                    'columns': list(df.columns),
-                    'shape': [int(df.shape[0]), int(df.shape[1])],
-                    'dtypes': {str(k): str(v) for k, v in df.dtypes.to_dict().items()}
-                }
+                # Process Excel file; calamine (Rust) is far faster than openpyxl when installed
+                try:
+                    df = pd.read_excel(self._binary_source(content, filepath), engine='calamine')
+                except ImportError:
+                    df = pd.read_excel(self._binary_source(content, filepath))
+                return self._dataframe_payload('excel', filename, df)
             
             elif file_ext == '.json':
-                # Process JSON file
-                text_content = content.decode('utf-8')
-                json_data = json.loads(text_content)
+                # Process JSON file; orjson parses and validates UTF-8 from the raw buffer itself
+                json_data = orjson.loads(memoryview(content))
                 return {
                     'type': 'json',
                     'filename': filename,
@@ -145,25 +169,25 @@ class ToolExecutor:
             
             elif file_ext == '.txt':
                 # Process text file
-                text_content = content.decode('utf-8')
+                text_content = str(content, 'utf-8')
                 return {
                     'type': 'text',
                     'filename': filename,
                     'content': text_content,
                     'length': len(text_content),
-                    'lines': len(text_content.split('\n'))
+                    'lines': self._count_lines(text_content)
                 }
             
             else:
                 # Try to decode as text for other formats
                 try:
-                    text_content = content.decode('utf-8')
+                    text_content = str(content, 'utf-8')
                     return {
                         'type': 'text',
                         'filename': filename,
                         'content': text_content,
                         'length': len(text_content),
-                        'lines': len(text_content.split('\n'))
+                        'lines': self._count_lines(text_content)
                     }
                 except UnicodeDecodeError:
                     return {
@@ -181,35 +205,70 @@ class ToolExecutor:
                 'error': str(e)
             }
     
-    def _analyze_json_structure(self, data: Any, max_depth: int = 3) -> Dict[str, Any]:
-        """Analyze JSON structure to provide metadata."""
-        if max_depth <= 0:
+    @staticmethod
+    def _dataframe_payload(file_type: str, filename: str, df: Any) -> Dict[str, Any]:
+        """Reader result for a parsed DataFrame; only the preview rows are materialized."""
+        return {
+            'type': file_type,
+            'filename': filename,
+            'data': df,
+            'sample_data': df.head(5).to_dict('records'),
+            'columns': list(df.columns),
+            'shape': [int(df.shape[0]), int(df.shape[1])],
+            'dtypes': {str(k): str(v) for k, v in df.dtypes.to_dict().items()}
+        }
+    
+    @staticmethod
+    def _count_lines(text: str) -> int:
+        """Count lines with a single scan; a trailing newline does not start a new line."""
+        return text.count('\n') + (1 if text and not text.endswith('\n') else 0)
+    
+    @staticmethod
+    def _binary_source(content: Any, filepath: Optional[str]) -> Any:
+        """What to hand pandas: the file path when there is one, else an in-memory stream."""
+        return filepath if filepath else io.BytesIO(content)
+    
+    def _analyze_json_structure(self, data: Any, max_depth: int = 3, max_nodes: int = 500,
+                                _budget: Optional[list] = None) -> Dict[str, Any]:
+        """Analyze JSON structure to provide metadata, visiting at most max_nodes nodes."""
+        if _budget is None:
+            _budget = [max_nodes]
+        _budget[0] -= 1
+        if max_depth <= 0 or _budget[0] < 0:
             return {"type": type(data).__name__, "truncated": True}
         
-        if isinstance(data, dict):
-            return {
-                "type": "dict",
-                "keys": list(data.keys())[:10],  # Limit to first 10 keys
-                "key_count": len(data),
-                "sample_values": {
-                    k: self._analyze_json_structure(v, max_depth - 1) 
-                    for k, v in list(data.items())[:3]  # Sample first 3 items
-                }
-            }
-        elif isinstance(data, list):
-            return {
-                "type": "list",
-                "length": len(data),
-                "sample_items": [
-                    self._analyze_json_structure(item, max_depth - 1) 
-                    for item in data[:3]  # Sample first 3 items
-                ]
-            }
-        else:
-            return {
-                "type": type(data).__name__,
-                "value": str(data)[:100] if isinstance(data, str) else data
+        return self._describe_json_node(data, max_depth, max_nodes, _budget)
+    
+    @functools.singledispatchmethod
+    def _describe_json_node(self, data: Any, max_depth: int, max_nodes: int, _budget: list) -> Dict[str, Any]:
+        """Describe one JSON node; dispatched on its type, scalars fall through to here."""
+        return {
+            "type": type(data).__name__,
+            "value": str(data)[:100] if isinstance(data, str) else data
+        }
+    
+    @_describe_json_node.register
+    def _(self, data: dict, max_depth: int, max_nodes: int, _budget: list) -> Dict[str, Any]:
+        return {
+            "type": "dict",
+            "keys": list(itertools.islice(data, 10)),  # Limit to first 10 keys
+            "key_count": len(data),
+            "sample_values": {
+                k: self._analyze_json_structure(v, max_depth - 1, max_nodes, _budget)
+                for k, v in itertools.islice(data.items(), 3)  # Sample first 3 items
             }
+        }
+    
+    @_describe_json_node.register
+    def _(self, data: list, max_depth: int, max_nodes: int, _budget: list) -> Dict[str, Any]:
+        return {
+            "type": "list",
+            "length": len(data),
+            "sample_items": [
+                self._analyze_json_structure(item, max_depth - 1, max_nodes, _budget)
+                for item in itertools.islice(data, 3)  # Sample first 3 items
+            ]
+        }
     
     def get_available_tools(self) -> Dict[str, str]:
         """
@@ -236,10 +295,10 @@ class ToolExecutor:
             True if parameters are valid, False otherwise
         """
         if tool_name == 'web_scraper':
-            return 'url' in parameters and parameters['url']
+            return bool(parameters.get('url') or parameters.get('urls'))
         elif tool_name == 'data_inspector':
             return 'data' in parameters
         elif tool_name == 'data_reader':
-            return 'content' in parameters
+            return 'content' in parameters or 'path' in parameters
         else:
             return True  # Assume valid for unknown tools
\ No newline at end of file
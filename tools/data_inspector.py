@@ -3,13 +3,52 @@ Data Inspector tool - Analyzes data structure and extracts compact metadata.
 Provides structural metadata for different types of data sources.
 """
 
+import sys
+import functools
+import itertools
 import logging
 from typing import Dict, Any, Union, List
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+
+try:
+    import numba
+except ImportError:  # Optional: only speeds up statistics on very large numeric columns
+    numba = None
 
 logger = logging.getLogger(__name__)
 
+# Substrings identifying each column category, checked in order.
+# Covers both numpy (float64) and Arrow (double, decimal128) type names
+_DTYPE_CATEGORY_MARKERS = (
+    ("numeric", ('int', 'float', 'double', 'decimal', 'number')),
+    ("datetime", ('datetime', 'timestamp', 'date')),
+    ("boolean", ('bool',)),
+)
+
+_MAX_TABLE_SUMMARIES = 20
+
+# Below this many values the JIT dispatch overhead outweighs the single-pass gain
+_NUMBA_MIN_VALUES = 100_000
+
+if numba is not None:
+    # Only reassociation (so the sum vectorizes): full fastmath assumes no inf/NaN, which
+    # to_numeric can still produce from strings like 'inf'
+    @numba.njit(cache=True, fastmath={'reassoc', 'contract'})
+    def _fused_min_max_mean(arr):
+        """min, max and mean in one pass over the buffer."""
+        mn = arr[0]
+        mx = arr[0]
+        total = 0.0
+        for i in range(arr.size):
+            v = arr[i]
+            mn = min(mn, v)
+            mx = max(mx, v)
+            total += v
+        return mn, mx, total / arr.size
+
+
 def inspect_data(data: Any, source_type: str = 'unknown') -> Dict[str, Any]:
     """
     Inspect data and extract compact metadata.
@@ -139,8 +178,8 @@ def _analyze_html_data(data: Dict[str, Any]) -> Dict[str, Any]:
             "image_count": len(structure.get("images", []))
         },
         "tables": _summarize_tables(structure.get("tables", [])),
-        "headings": [h.get("text", "") for h in structure.get("headings", [])[:10]],
-        "key_content": structure.get("paragraphs", [])[:5]
+        "headings": [h.get("text", "") for h in itertools.islice(structure.get("headings", ()), 10)],
+        "key_content": list(itertools.islice(structure.get("paragraphs", ()), 5))
     }
 
 def _analyze_json_data(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -179,22 +218,20 @@ def _analyze_dataframe_data(file_data: Dict[str, Any]) -> Dict[str, Any]:
     columns = file_data.get("columns", [])
     shape = file_data.get("shape", (0, 0))
     dtypes = file_data.get("dtypes", {})
-    sample_data = file_data.get("data", [])
+    sample_data = file_data.get("sample_data", [])
     
-    # Analyze column types
+    # Analyze column types and count categories in the same pass
     column_analysis = {}
+    numeric_count = text_count = 0
     for col in columns:
         dtype = str(dtypes.get(col, 'unknown'))
+        category = _categorize_column_type(dtype)
         column_analysis[col] = {
             "type": dtype,
-            "category": _categorize_column_type(dtype)
+            "category": category
         }
-    
-    # Get basic statistics
-    numeric_columns = [col for col, info in column_analysis.items() 
-                      if info["category"] == "numeric"]
-    text_columns = [col for col, info in column_analysis.items() 
-                   if info["category"] == "text"]
+        numeric_count += category == "numeric"
+        text_count += category == "text"
     
     return {
         "shape": shape,
@@ -203,8 +240,8 @@ def _analyze_dataframe_data(file_data: Dict[str, Any]) -> Dict[str, Any]:
         "row_count": shape[0] if shape else 0,
         "column_analysis": column_analysis,
         "summary": {
-            "numeric_columns": len(numeric_columns),
-            "text_columns": len(text_columns),
+            "numeric_columns": numeric_count,
+            "text_columns": text_count,
             "total_columns": len(columns)
         },
         "sample_data": sample_data[:5],
@@ -237,7 +274,8 @@ def _summarize_tables(tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Summarize table structures."""
     summaries = []
     
-    for i, table in enumerate(tables):
+    # Only the first few tables are useful to the prompt; pages can carry hundreds
+    for i, table in enumerate(itertools.islice(tables, _MAX_TABLE_SUMMARIES)):
         headers = table.get("headers", [])
         row_count = table.get("row_count", 0)
         
@@ -246,24 +284,21 @@ def _summarize_tables(tables: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             "headers": headers,
             "column_count": len(headers),
             "row_count": row_count,
-            "sample_data": table.get("rows", [])[:3]
+            "sample_data": list(itertools.islice(table.get("rows", ()), 3))
         }
         summaries.append(summary)
     
     return summaries
 
+@functools.lru_cache(maxsize=128)
 def _categorize_column_type(dtype_str: str) -> str:
-    """Categorize column data type."""
+    """Categorize column data type (cached: dtype strings repeat across columns)."""
     dtype_lower = dtype_str.lower()
     
-    if any(t in dtype_lower for t in ['int', 'float', 'number']):
-        return "numeric"
-    elif any(t in dtype_lower for t in ['datetime', 'timestamp', 'date']):
-        return "datetime"
-    elif any(t in dtype_lower for t in ['bool', 'boolean']):
-        return "boolean"
-    else:
-        return "text"
+    for category, markers in _DTYPE_CATEGORY_MARKERS:
+        if any(marker in dtype_lower for marker in markers):
+            return category
+    return "text"
 
 def _get_data_summary(data: Any) -> Dict[str, Any]:
     """Get a general summary of any data structure."""
@@ -271,31 +306,80 @@ def _get_data_summary(data: Any) -> Dict[str, Any]:
         "type": type(data).__name__,
         "size": _estimate_data_size(data)
     }
-    
-    if isinstance(data, dict):
-        summary.update({
-            "key_count": len(data),
-            "keys": list(data.keys())[:10]
-        })
-    elif isinstance(data, list):
-        summary.update({
-            "length": len(data),
-            "item_types": list(set(type(item).__name__ for item in data[:100]))
-        })
-    elif isinstance(data, str):
-        summary.update({
-            "length": len(data),
-            "word_count": len(data.split()),
-            "preview": data[:200]
-        })
-    
+    summary.update(_summary_details(data))
     return summary
 
+@functools.singledispatch
+def _summary_details(data: Any) -> Dict[str, Any]:
+    """Type-specific summary fields; types without a handler add nothing."""
+    return {}
+
+@_summary_details.register
+def _(data: dict) -> Dict[str, Any]:
+    return {
+        "key_count": len(data),
+        "keys": list(itertools.islice(data, 10))
+    }
+
+@_summary_details.register
+def _(data: list) -> Dict[str, Any]:
+    return {
+        "length": len(data),
+        "item_types": _sample_item_types(data)
+    }
+
+@_summary_details.register
+def _(data: str) -> Dict[str, Any]:
+    return {
+        "length": len(data),
+        "word_count": len(data.split()),
+        "preview": data[:200]
+    }
+
+@_summary_details.register
+def _(data: pd.DataFrame) -> Dict[str, Any]:
+    return {
+        "shape": [int(data.shape[0]), int(data.shape[1])],
+        "columns": [str(c) for c in itertools.islice(data.columns, 10)]
+    }
+
+@_summary_details.register
+def _(data: pa.Table) -> Dict[str, Any]:
+    return {
+        "shape": [data.num_rows, data.num_columns],
+        "columns": data.schema.names[:10]
+    }
+
+@_summary_details.register
+def _(data: np.ndarray) -> Dict[str, Any]:
+    return {
+        "shape": list(data.shape),
+        "dtype": str(data.dtype)
+    }
+
+def _sample_item_types(data: list, sample_size: int = 100) -> List[str]:
+    """Type names among the first items; homogeneous lists (the usual case) exit on identity checks."""
+    if not data:
+        return []
+    first_type = type(data[0])
+    if all(type(item) is first_type for item in itertools.islice(data, 1, sample_size)):
+        return [first_type.__name__]
+    return list({type(item).__name__ for item in itertools.islice(data, sample_size)})
+
 def _estimate_data_size(data: Any) -> str:
     """Estimate the size of data structure."""
     try:
-        import sys
-        size_bytes = sys.getsizeof(data)
+        # Tables and arrays know their buffer sizes; getsizeof only sees the container header
+        if isinstance(data, (pa.Table, np.ndarray)):
+            size_bytes = data.nbytes
+        elif isinstance(data, pd.DataFrame):
+            size_bytes = int(data.memory_usage(deep=True).sum())
+        elif isinstance(data, pd.Series):
+            size_bytes = int(data.memory_usage(deep=True))
+        elif isinstance(data, (str, bytes, bytearray)):
+            size_bytes = len(data)
+        else:
+            size_bytes = sys.getsizeof(data)
         
         if size_bytes < 1024:
             return f"{size_bytes} bytes"
@@ -318,41 +402,60 @@ def get_column_statistics(data: List[Dict[str, Any]], column: str) -> Dict[str,
         Dictionary with column statistics
     """
     try:
-        # Extract column values
-        values = [row.get(column) for row in data if column in row]
-        non_null_values = [v for v in values if v is not None and v != '']
+        # Build the column once; pandas does the null filtering, uniqueness and numeric parsing in C.
+        # Rows without the column are filled with NaN and counted as nulls
+        values = pd.DataFrame.from_records(data, columns=[column])[column]
+        non_null_values = values[values.notna() & (values != '')]
         
-        if not non_null_values:
+        if non_null_values.empty:
             return {"error": "No valid values found in column"}
         
+        # One hashing pass over the native values; dict keeps first-seen order for the samples.
+        # Unhashable values (nested dicts/lists) fall back to their repr
+        try:
+            seen = dict.fromkeys(non_null_values)
+        except TypeError:
+            seen = dict.fromkeys(repr(v) for v in non_null_values)
+        
         # Basic statistics
         stats = {
             "total_count": len(values),
             "non_null_count": len(non_null_values),
             "null_count": len(values) - len(non_null_values),
-            "unique_count": len(set(str(v) for v in non_null_values))
+            "unique_count": len(seen)
         }
         
-        # Try to convert to numeric for more stats
-        try:
-            numeric_values = [float(v) for v in non_null_values 
-                            if str(v).replace('.', '').replace('-', '').isdigit()]
-            
-            if numeric_values:
-                stats.update({
-                    "numeric_count": len(numeric_values),
-                    "min": min(numeric_values),
-                    "max": max(numeric_values),
-                    "mean": sum(numeric_values) / len(numeric_values),
-                    "median": sorted(numeric_values)[len(numeric_values) // 2]
-                })
-        except:
-            pass
+        # Numeric stats over every value that parses as a number (including negatives and 1e3 style)
+        # Booleans count as numeric to pandas but are summarized as categories, as before
+        if pd.api.types.is_bool_dtype(non_null_values):
+            numeric_values = None
+        elif pd.api.types.is_numeric_dtype(non_null_values):
+            # from_records already inferred a numeric dtype; no per-value parsing needed
+            numeric_values = non_null_values
+        elif pd.api.types.infer_dtype(non_null_values, skipna=True) == 'boolean':
+            # Booleans with nulls arrive as an object column
+            numeric_values = None
+        else:
+            numeric_values = pd.to_numeric(non_null_values, errors='coerce').dropna()
+        if numeric_values is not None and not numeric_values.empty:
+            # One contiguous float64 buffer; np.median selects via partition instead of a full sort
+            arr = numeric_values.to_numpy(dtype=np.float64)
+            if numba is not None and arr.size >= _NUMBA_MIN_VALUES:
+                col_min, col_max, col_mean = _fused_min_max_mean(arr)
+            else:
+                col_min, col_max, col_mean = arr.min(), arr.max(), arr.mean()
+            stats.update({
+                "numeric_count": int(arr.size),
+                "min": float(col_min),
+                "max": float(col_max),
+                "mean": float(col_mean),
+                "median": float(np.median(arr))
+            })
         
         # Sample values
-        stats["sample_values"] = list(set(str(v) for v in non_null_values))[:10]
+        stats["sample_values"] = [str(v) for v in itertools.islice(seen, 10)]
         
         return stats
     
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
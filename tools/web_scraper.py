@@ -3,23 +3,127 @@ Web Scraper tool - Fetches and extracts content from web pages.
 Handles various types of web content and extracts structured data.
 """
 
+import os
+import copy
+import asyncio
 import requests
+import aiohttp
 import logging
-from bs4 import BeautifulSoup
-from typing import Dict, Any, Optional, List
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_cache import CachedSession, CacheActions
+from bs4 import BeautifulSoup, SoupStrainer
+from typing import Dict, Any, Optional, List, Union
 import time
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from urllib.parse import urljoin, urlparse
 import re
 
 logger = logging.getLogger(__name__)
 
-def scrape_url(url: str, timeout: int = 30) -> Dict[str, Any]:
+# libxml2-backed lxml is several times faster than the pure-Python html.parser; without it large
+# pages are also read whole instead of through its incremental parser
+try:
+    from lxml import etree
+    _HTML_PARSER = 'lxml'
+except ImportError:
+    etree = None
+    _HTML_PARSER = 'html.parser'
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _FastHTMLParser
+except ImportError:  # Optional: a C DOM that extracts several times faster than BeautifulSoup
+    _FastHTMLParser = None
+
+# The only tags the extractors read; everything else (scripts, styles, svg, layout wrappers) is
+# skipped while parsing. A matching tag keeps its whole subtree
+_HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']
+_STRAINED_TAGS = ('title', 'meta', *_HEADING_TAGS, 'p', 'table', 'tr', 'td', 'th', 'a', 'img')
+_STRAINER = SoupStrainer(list(_STRAINED_TAGS))
+
+# HTML bodies larger than this (by Content-Length) are parsed incrementally instead of as one DOM
+_STREAM_HTML_THRESHOLD = 5 * 1024 * 1024
+# Elements whose subtree the incremental parser keeps until they close, since their text is extracted
+_STREAM_CAPTURE_TAGS = frozenset(('title', *_HEADING_TAGS, 'p', 'a', 'tr'))
+
+# Bodies that are read into memory (everything but streamed HTML) are refused past this size
+_MAX_DOWNLOAD_BYTES = int(os.getenv('SCRAPE_MAX_BYTES', 10 * 1024 * 1024))
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+_ABSOLUTE_URL_PREFIXES = ('http://', 'https://')
+_SKIPPED_HREF_PREFIXES = ('javascript:', 'mailto:', '#')
+
+# Caps shared by both HTML parsing paths
+_MAX_HEADINGS = 20
+_MAX_PARAGRAPHS = 10
+_MAX_LINKS = 50
+_MAX_IMAGES = 20
+_MAX_TABLES = 20
+_MAX_TABLE_ROWS = 50
+
+# How many candidate tags find_all may collect before filtering empties down to the caps above
+_PARAGRAPH_SCAN_LIMIT = 64
+_LINK_SCAN_LIMIT = 128
+_IMAGE_SCAN_LIMIT = 32
+_MAX_TEXT_LENGTH = 50000  # 50KB
+_MAX_CSV_ROWS = 100
+
+# Headers to mimic a real browser
+_DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'br, gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# Shared session so repeated scrapes reuse pooled keep-alive connections instead of a new
+# TCP/TLS handshake per call; transient gateway errors are retried with backoff.
+# Responses are cached on disk (honouring Cache-Control/ETag), so re-scraping a URL is a local
+# lookup or a cheap conditional GET; a stale copy is served if the refresh fails
+_SESSION = CachedSession(
+    os.path.join(os.getenv('SCRAPE_CACHE_DIR', os.path.join('.cache', 'scrape')), 'http_cache'),
+    backend='sqlite',
+    expire_after=int(os.getenv('SCRAPE_CACHE_TTL', 3600)),
+    cache_control=True,
+    stale_if_error=True,
+    filter_fn=lambda response: _is_cacheable_size(response)
+)
+_SESSION.headers.update(_DEFAULT_HEADERS)
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+)
+_SESSION.mount('https://', _adapter)
+_SESSION.mount('http://', _adapter)
+
+# Session settings minus the size filter, for saving chunked bodies once their size is known
+_SAVE_SETTINGS = copy.copy(_SESSION.settings)
+_SAVE_SETTINGS.filter_fn = None
+
+# Parsed results keyed by (url, validator, max_bytes), so a response whose ETag / Last-Modified (or
+# cached copy) is unchanged skips re-parsing as well as the download; evicted oldest-first
+_PARSED_CACHE_SIZE = 256
+_PARSED_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_PARSED_CACHE_LOCK = threading.Lock()
+
+def scrape_url(url: str, timeout: int = 30, bypass_cache: bool = False,
+               max_bytes: int = _MAX_DOWNLOAD_BYTES) -> Dict[str, Any]:
     """
     Scrape content from a given URL.
     
     Args:
         url: The URL to scrape
         timeout: Request timeout in seconds
+        bypass_cache: Fetch a fresh copy even if a cached response is still valid
+        max_bytes: Largest body read into memory; large HTML pages are streamed instead
         
     Returns:
         Dictionary containing scraped content and metadata
@@ -35,30 +139,33 @@ def scrape_url(url: str, timeout: int = 30) -> Dict[str, Any]:
                 "url": url
             }
         
-        # Set up headers to mimic a real browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        }
-        
-        # Make request with timeout
-        response = requests.get(url, headers=headers, timeout=timeout)
+        # Make request with timeout; the body is only read once we know how to parse it
+        # The cache reads a body in full to store it, so a cap tighter than the session's skips it.
+        # no-store rather than expire_after, which a response's own Cache-Control would override
+        cache_options = {'headers': {'Cache-Control': 'no-store'}} if max_bytes < _MAX_DOWNLOAD_BYTES else {}
+        response = _SESSION.get(url, timeout=timeout, force_refresh=bypass_cache, stream=True,
+                                **cache_options)
         response.raise_for_status()
         
+        cache_key = _parsed_cache_key(url, response, max_bytes)
+        cached = _get_parsed(cache_key)
+        if cached is not None:
+            response.close()
+            return cached
+        
         # Parse content based on content type
         content_type = response.headers.get('content-type', '').lower()
-        
-        if 'text/html' in content_type:
-            return _parse_html_content(response.text, url)
-        elif 'application/json' in content_type:
-            return _parse_json_content(response.text, url)
-        elif 'text/csv' in content_type:
-            return _parse_csv_content(response.text, url)
+        if _is_streamed_html(content_type, response):
+            result = _parse_html_stream(response, url)
         else:
-            return _parse_text_content(response.text, url, content_type)
+            content = _read_capped(response, max_bytes)
+            if content is None:
+                return _too_large_result(url, max_bytes)
+            if _is_chunked(response):
+                _save_chunked(response, content)
+            result = _parse_response(_FetchedBody(content, response.encoding), url, content_type)
+        _store_parsed(cache_key, result)
+        return result
     
     except requests.exceptions.Timeout:
         logger.error(f"Timeout while scraping {url}")
@@ -84,18 +191,444 @@ def scrape_url(url: str, timeout: int = 30) -> Dict[str, Any]:
             "url": url
         }
 
+def _parsed_cache_key(url: str, response: requests.Response, max_bytes: int) -> Optional[tuple]:
+    """
+    Key identifying this exact body read under this cap, or None if the response carries nothing
+    to tell versions apart.
+    """
+    validator = response.headers.get('etag') or response.headers.get('last-modified')
+    if validator is None and getattr(response, 'from_cache', False):
+        # Same stored copy as last time
+        validator = response.created_at.isoformat()
+    return (url, validator, max_bytes) if validator else None
+
+def _get_parsed(key: Optional[tuple]) -> Optional[Dict[str, Any]]:
+    if key is None:
+        return None
+    with _PARSED_CACHE_LOCK:
+        result = _PARSED_CACHE.get(key)
+        if result is None:
+            return None
+        _PARSED_CACHE.move_to_end(key)
+    logger.info(f"Parsed result cache hit for {key[0]}")
+    # Callers may mutate the result, so never hand out the cached dict itself
+    return copy.deepcopy(result)
+
+def _store_parsed(key: Optional[tuple], result: Dict[str, Any]) -> None:
+    if key is None or not result.get('success'):
+        return
+    result = copy.deepcopy(result)
+    with _PARSED_CACHE_LOCK:
+        _PARSED_CACHE[key] = result
+        _PARSED_CACHE.move_to_end(key)
+        while len(_PARSED_CACHE) > _PARSED_CACHE_SIZE:
+            _PARSED_CACHE.popitem(last=False)
+
+async def scrape_urls(urls: List[str], timeout: int = 30, max_concurrency: int = 64,
+                      max_bytes: int = _MAX_DOWNLOAD_BYTES) -> List[Dict[str, Any]]:
+    """
+    Scrape several URLs concurrently over one aiohttp session.
+    
+    Args:
+        urls: The URLs to scrape
+        timeout: Per-request timeout in seconds
+        max_concurrency: Maximum number of requests in flight at once
+        max_bytes: Largest body downloaded per URL
+        
+    Returns:
+        One result per URL, in the same order, shaped like scrape_url's; a failure only affects its own entry
+    """
+    logger.info(f"Starting web scraping for {len(urls)} URLs")
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    connector = aiohttp.TCPConnector(limit=256, limit_per_host=64)
+    async with aiohttp.ClientSession(headers=_DEFAULT_HEADERS, connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        results = await asyncio.gather(
+            *(_scrape_one(session, semaphore, url, timeout, max_bytes) for url in urls),
+            return_exceptions=True
+        )
+    
+    return [
+        {"success": False, "error": f"Unexpected error: {str(result)}", "url": url}
+        if isinstance(result, BaseException) else result
+        for url, result in zip(urls, results)
+    ]
+
+def scrape_urls_threaded(urls: List[str], max_workers: int = 32, timeout: int = 30) -> List[Dict[str, Any]]:
+    """
+    Scrape several URLs in parallel threads through the shared cached session, for callers
+    that cannot run an event loop. Keep max_workers within the adapter's pool_maxsize (64),
+    or threads stall waiting for a free connection.
+    
+    Returns:
+        One scrape_url result per URL, in the same order
+    """
+    if not urls:
+        return []
+    
+    logger.info(f"Starting threaded web scraping for {len(urls)} URLs")
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        return list(executor.map(lambda url: scrape_url(url, timeout), urls))
+
+async def _scrape_one(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                      url: str, timeout: int, max_bytes: int) -> Dict[str, Any]:
+    """Fetch one URL for scrape_urls and parse it off the event loop."""
+    if not _is_valid_url(url):
+        return {
+            "success": False,
+            "error": "Invalid URL format",
+            "url": url
+        }
+    
+    try:
+        async with semaphore:
+            content_type, body = await _fetch(session, url, max_bytes)
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout while scraping {url}")
+        return {
+            "success": False,
+            "error": f"Request timeout after {timeout} seconds",
+            "url": url
+        }
+    except aiohttp.ClientError as e:
+        logger.error(f"Request error while scraping {url}: {str(e)}")
+        return {
+            "success": False,
+            "error": f"Request failed: {str(e)}",
+            "url": url
+        }
+    
+    if body is None:
+        return _too_large_result(url, max_bytes)
+    
+    # Parsing is CPU-bound; keep it from stalling the other downloads
+    return await asyncio.to_thread(_parse_response, body, url, content_type)
+
+class _FetchedBody:
+    """A downloaded body with the .content / lazily decoded .text pair of requests.Response."""
+    
+    __slots__ = ('content', 'encoding')
+    
+    def __init__(self, content: bytes, encoding: Optional[str]):
+        self.content = content
+        self.encoding = encoding
+    
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+async def _fetch(session: aiohttp.ClientSession, url: str, max_bytes: int):
+    """GET a URL, returning (lowercased content type, body), or a None body past max_bytes."""
+    async with session.get(url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('content-type', '').lower()
+        if (response.content_length or 0) > max_bytes:
+            return content_type, None
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) > max_bytes:
+                return content_type, None
+        return content_type, _FetchedBody(bytes(buffer), response.charset)
+
+def _read_capped(response: requests.Response, max_bytes: int) -> Optional[bytes]:
+    """Read a streamed body, giving up (and closing the connection) once it exceeds max_bytes."""
+    if _declared_length(response) > max_bytes:
+        response.close()
+        return None
+    buffer = bytearray()
+    for chunk in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            response.close()
+            return None
+    return bytes(buffer)
+
+def _too_large_result(url: str, max_bytes: int) -> Dict[str, Any]:
+    logger.error(f"Response from {url} exceeds {max_bytes} bytes")
+    return {
+        "success": False,
+        "error": f"Response too large (over {max_bytes} bytes)",
+        "url": url
+    }
+
+def _parse_response(body: Any, url: str, content_type: str) -> Dict[str, Any]:
+    """
+    Dispatch a fetched body to the parser for its content type.
+    body is a requests.Response or _FetchedBody; JSON is parsed from the raw bytes, so only
+    the other types pay for decoding to str.
+    """
+    parser = _PARSERS.get(_mime_type(content_type))
+    if parser is None:
+        return _parse_text_content(body.text, url, content_type)
+    return parser(body, url)
+
+def _mime_type(content_type: str) -> str:
+    """The bare MIME type of a lowercased Content-Type header, without parameters like charset."""
+    return content_type.split(';', 1)[0].strip()
+
+def _declared_length(response: requests.Response) -> int:
+    """The Content-Length of a response, or 0 if absent or malformed."""
+    try:
+        return int(response.headers.get('content-length', 0))
+    except ValueError:
+        return 0
+
+def _is_streamed_html(content_type: str, response: requests.Response) -> bool:
+    """Whether an HTML response is large enough (by declared size) for incremental parsing."""
+    return (etree is not None and _mime_type(content_type) == 'text/html'
+            and _declared_length(response) > _STREAM_HTML_THRESHOLD)
+
+def _is_chunked(response: requests.Response) -> bool:
+    """Whether a freshly fetched response has no declared length."""
+    return not getattr(response, 'from_cache', False) and 'content-length' not in response.headers
+
+def _is_cacheable_size(response: requests.Response) -> bool:
+    """
+    requests-cache reads the whole body to store it, before scrape_url can apply its byte cap, so
+    only responses whose declared length is small enough to read in full are cached here. Bodies of
+    unknown length (chunked) are saved by _save_chunked once read within the cap; pages large
+    enough to be streamed are left uncached.
+    """
+    # Already stored (so already checked), or a bodiless revalidation of a stored copy
+    if getattr(response, 'from_cache', False) or response.status_code == 304:
+        return True
+    if 'content-length' not in response.headers:
+        return False
+    if _is_streamed_html(response.headers.get('content-type', '').lower(), response):
+        return False
+    return _declared_length(response) <= _MAX_DOWNLOAD_BYTES
+
+def _save_chunked(response: requests.Response, content: bytes) -> None:
+    """Cache a chunked body read by _read_capped, with the expiry requests-cache would have given it."""
+    actions = CacheActions.from_request(_SESSION.cache.create_key(response.request), response.request,
+                                        _SAVE_SETTINGS)
+    actions.update_from_response(response)
+    if actions.skip_write:
+        return
+    # save_response stores response.content, which iter_content has already consumed
+    response._content = content
+    try:
+        _SESSION.cache.save_response(response, actions.cache_key, actions.expires)
+    except Exception as e:
+        logger.warning(f"Could not cache response from {response.url}: {str(e)}")
+
+def _parse_html_stream(response: requests.Response, url: str) -> Dict[str, Any]:
+    """
+    Parse a large HTML response incrementally with lxml's pull parser.
+    Produces the same result as _parse_html_content, but never holds the whole page as a str or
+    a full DOM: the text inside extracted tags is collected as the parser reaches it, and every
+    element is cleared once it has closed, unless it is inside an element still being extracted
+    (a title, heading, paragraph, link or table row).
+    """
+    try:
+        # Only trust an explicit charset; otherwise let lxml sniff <meta charset>
+        encoding = response.encoding if 'charset=' in response.headers.get('content-type', '').lower() else None
+        parser = etree.HTMLPullParser(events=('start', 'end', 'comment', 'pi'), encoding=encoding)
+        
+        result = {"headings": [], "paragraphs": [], "tables": [], "links": [], "images": []}
+        text_parts = []
+        text_budget = [2 * _MAX_TEXT_LENGTH]  # raw characters; whitespace collapses when cleaned
+        open_tables: List[Dict[str, Any]] = []
+        open_rows: List[list] = []  # per open <tr>: (table, reserved row slot, is first row)
+        capture_depth = 0
+        strained_depth = 0  # open _STRAINED_TAGS elements; like the strained soup, text outside them is skipped
+        
+        def reached(node) -> None:
+            # Everything before node has been parsed: collect the text leading up to it and drop
+            # the earlier siblings, which are fully processed
+            previous = node.getprevious()
+            parent = node.getparent()
+            if previous is None:
+                if parent is not None and strained_depth:
+                    _append_text(text_parts, text_budget, parent.text)
+                return
+            if strained_depth:
+                _append_text(text_parts, text_budget, previous.tail)
+            if capture_depth == 0 and parent is not None:
+                while node.getprevious() is not None:
+                    del parent[0]
+        
+        def handle(event: str, el) -> None:
+            nonlocal capture_depth, strained_depth
+            if event != 'start' and event != 'end':
+                reached(el)  # comment / processing instruction; its own text is not page text
+                return
+            tag = el.tag if isinstance(el.tag, str) else ''
+            
+            if event == 'start':
+                reached(el)
+                if tag in _STREAM_CAPTURE_TAGS:
+                    capture_depth += 1
+                if tag in _STRAINED_TAGS:
+                    strained_depth += 1
+                if tag == 'table':
+                    # Reserved at the start tag, so tables come out in document order although
+                    # nested ones close first; like find_all's limit, only the first few are kept
+                    slot = None
+                    if len(result["tables"]) < _MAX_TABLES:
+                        slot = len(result["tables"])
+                        result["tables"].append(None)
+                    open_tables.append({'slot': slot, 'started_rows': 0, 'headers': [], 'rows': [], 'row_count': 0})
+                elif tag == 'tr':
+                    # Reserve the row's place now, so rows of nested tables (which close first)
+                    # still come out in document order
+                    reservations = []
+                    for table in open_tables:
+                        slot = None
+                        if len(table['rows']) < _MAX_TABLE_ROWS:
+                            slot = len(table['rows'])
+                            table['rows'].append(None)
+                        reservations.append((table, slot, table['started_rows'] == 0))
+                        table['started_rows'] += 1
+                    open_rows.append(reservations)
+                return
+            
+            # The element's own text was collected when its first child started; otherwise do it now
+            if tag not in ('script', 'style') and strained_depth:
+                _append_text(text_parts, text_budget, el[-1].tail if len(el) else el.text)
+            _extract_stream_element(el, tag, url, result, open_tables, open_rows)
+            if tag in _STREAM_CAPTURE_TAGS:
+                capture_depth = max(capture_depth - 1, 0)
+            if tag in _STRAINED_TAGS:
+                strained_depth = max(strained_depth - 1, 0)
+            if capture_depth == 0:
+                # Its tail is collected when the next sibling starts (or the parent closes)
+                el.clear(keep_tail=True)
+        
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            parser.feed(chunk)
+            for event, el in parser.read_events():
+                handle(event, el)
+        parser.close()
+        for event, el in parser.read_events():
+            handle(event, el)
+        
+        # Separate text nodes the way get_text(' ') does
+        cleaned_text = _clean_text(' '.join(text_parts))
+        if text_budget[0] < 0 and not cleaned_text.endswith("[TRUNCATED]"):
+            cleaned_text += "... [TRUNCATED]"
+        
+        return {
+            "success": True,
+            "url": url,
+            "content_type": "html",
+            "title": result.get("title", "No title"),
+            "description": result.get("description", ""),
+            "text_content": cleaned_text,
+            "word_count": len(cleaned_text.split()),
+            "structure": {
+                "headings": result["headings"],
+                "paragraphs": result["paragraphs"],
+                "tables": [table for table in result["tables"] if table is not None],
+                "links": result["links"],
+                "images": result["images"]
+            }
+        }
+    
+    except Exception as e:
+        logger.error(f"Error parsing HTML stream: {str(e)}")
+        return {
+            "success": False,
+            "error": f"HTML parsing failed: {str(e)}",
+            "url": url
+        }
+
+def _extract_stream_element(el, tag: str, base_url: str, result: Dict[str, Any],
+                            open_tables: List[Dict[str, Any]], open_rows: List[list]) -> None:
+    """Record the metadata a just-closed element contributes to a streamed HTML parse."""
+    if tag in ('script', 'style'):
+        # Drop the code, so it is not part of an enclosing element's text either
+        el.text = None
+        for child in list(el):
+            el.remove(child)
+    elif tag == 'title':
+        result.setdefault("title", ''.join(el.itertext()).strip())
+    elif tag == 'meta':
+        if el.get('name') == 'description':
+            result.setdefault("description", el.get('content', ''))
+    elif tag in _HEADING_TAGS:
+        if len(result["headings"]) < _MAX_HEADINGS:
+            result["headings"].append({'level': int(tag[1]), 'text': ''.join(el.itertext()).strip()})
+    elif tag == 'p':
+        if len(result["paragraphs"]) < _MAX_PARAGRAPHS:
+            text = ''.join(el.itertext()).strip()
+            if text:
+                result["paragraphs"].append(text)
+    elif tag == 'tr':
+        # Rows are tallied as they close, so a table never has to be held whole; like the
+        # non-streamed path, a nested table's rows also count towards the enclosing tables
+        if not open_rows:
+            return
+        cells = [''.join(cell.itertext()).strip() for cell in el.iter('td', 'th')]
+        for table, slot, is_first in open_rows.pop():
+            if is_first:
+                table['headers'] = cells
+            if cells:
+                table['row_count'] += 1
+            if slot is None:
+                continue
+            if cells:
+                table['rows'][slot] = cells
+            elif slot == len(table['rows']) - 1:
+                table['rows'].pop()
+    elif tag == 'table':
+        table = open_tables.pop() if open_tables else None
+        if table is None:
+            return
+        # Empty rows only leave a gap when a nested row was reserved after them
+        rows = [row for row in table['rows'] if row is not None]
+        if rows and table['slot'] is not None:
+            result["tables"][table['slot']] = {
+                'headers': table['headers'],
+                'rows': rows,
+                'row_count': table['row_count']
+            }
+    elif tag == 'a':
+        href = el.get('href')
+        if href is not None and len(result["links"]) < _MAX_LINKS and not _is_skipped_href(href):
+            text = ''.join(el.itertext()).strip()
+            absolute_url = _absolute_url(base_url, href)
+            if text and absolute_url:
+                result["links"].append({'text': text, 'url': absolute_url})
+    elif tag == 'img':
+        src = el.get('src')
+        if src and len(result["images"]) < _MAX_IMAGES:
+            result["images"].append({'src': _absolute_url(base_url, src), 'alt': el.get('alt', '')})
+
+def _append_text(parts: List[str], budget: List[int], text: Optional[str]) -> None:
+    """Collect page text until the raw-character budget is spent."""
+    if text and budget[0] > 0:
+        parts.append(text[:budget[0]])
+        budget[0] -= len(text)
+
 def _is_valid_url(url: str) -> bool:
     """Validate URL format."""
     try:
+        # Common case: http(s) with a host, checked without building a ParseResult
+        for prefix in _ABSOLUTE_URL_PREFIXES:
+            if url.startswith(prefix):
+                return url[len(prefix):len(prefix) + 1] not in ('', '/', '?', '#')
         result = urlparse(url)
-        return all([result.scheme, result.netloc])
-    except:
+        return bool(result.scheme and result.netloc)
+    except Exception:
         return False
 
+# Content-type specific parsers, keyed by bare MIME type; anything else is treated as plain text
+_PARSERS = {
+    'text/html': lambda body, url: _parse_html_content(body.text, url),
+    'application/json': lambda body, url: _parse_json_content(body.content, url),
+    'text/csv': lambda body, url: _parse_csv_content(body.text, url),
+}
+
 def _parse_html_content(html: str, url: str) -> Dict[str, Any]:
     """Parse HTML content and extract structured data."""
+    if _FastHTMLParser is not None:
+        return _parse_html_content_fast(html, url)
+    
     try:
-        soup = BeautifulSoup(html, 'html.parser')
+        soup = BeautifulSoup(html, _HTML_PARSER, parse_only=_STRAINER)
         
         # Extract basic metadata
         title = soup.find('title')
@@ -105,17 +638,19 @@ def _parse_html_content(html: str, url: str) -> Dict[str, Any]:
         meta_desc = soup.find('meta', attrs={'name': 'description'})
         description = meta_desc.get('content', '') if meta_desc else ''
         
-        # Extract headings
-        headings = []
-        for i in range(1, 7):
-            for heading in soup.find_all(f'h{i}'):
-                headings.append({
-                    'level': i,
-                    'text': heading.get_text().strip()
-                })
+        # Extract headings in one traversal, in document order
+        headings = [
+            {
+                'level': int(heading.name[1]),
+                # ' ' keeps words split across inline tags apart, which strip=True alone would glue
+                'text': heading.get_text(' ', strip=True)
+            }
+            for heading in soup.find_all(_HEADING_TAGS, limit=_MAX_HEADINGS)
+        ]
         
         # Extract paragraphs
-        paragraphs = [p.get_text().strip() for p in soup.find_all('p') if p.get_text().strip()]
+        paragraph_texts = (p.get_text().strip() for p in soup.find_all('p', limit=_PARAGRAPH_SCAN_LIMIT))
+        paragraphs = list(itertools.islice((text for text in paragraph_texts if text), _MAX_PARAGRAPHS))
         
         # Extract tables
         tables = _extract_tables(soup)
@@ -126,12 +661,95 @@ def _parse_html_content(html: str, url: str) -> Dict[str, Any]:
         # Extract images
         images = _extract_images(soup, url)
         
-        # Clean text content
-        # Remove scripts and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
+        # Clean text content: the strained soup only holds the extracted elements (script and
+        # style bodies are never part of get_text), so join their text with separators
+        text_content = soup.get_text(' ')
+        cleaned_text = _clean_text(text_content)
+        
+        return {
+            "success": True,
+            "url": url,
+            "content_type": "html",
+            "title": title_text,
+            "description": description,
+            "text_content": cleaned_text,
+            "word_count": len(cleaned_text.split()),
+            "structure": {
+                "headings": headings,
+                "paragraphs": paragraphs,
+                "tables": tables,
+                "links": links[:_MAX_LINKS],
+                "images": images[:_MAX_IMAGES]
+            }
+        }
+    
+    except Exception as e:
+        logger.error(f"Error parsing HTML content: {str(e)}")
+        return {
+            "success": False,
+            "error": f"HTML parsing failed: {str(e)}",
+            "url": url
+        }
+
+def _parse_html_content_fast(html: str, url: str) -> Dict[str, Any]:
+    """selectolax version of _parse_html_content, producing the same result shape."""
+    try:
+        tree = _FastHTMLParser(html)
+        # BeautifulSoup's get_text never includes these bodies
+        tree.strip_tags(['script', 'style', 'template'])
+        
+        title = tree.css_first('title')
+        title_text = title.text().strip() if title else "No title"
+        
+        meta_desc = tree.css_first('meta[name="description"]')
+        description = (meta_desc.attributes.get('content') or '') if meta_desc else ''
         
-        text_content = soup.get_text()
+        headings = [
+            {'level': int(heading.tag[1]), 'text': heading.text(separator=' ', strip=True, skip_empty=True)}
+            for heading in itertools.islice(tree.css(','.join(_HEADING_TAGS)), _MAX_HEADINGS)
+        ]
+        
+        paragraph_texts = (p.text().strip() for p in itertools.islice(tree.css('p'), _PARAGRAPH_SCAN_LIMIT))
+        paragraphs = list(itertools.islice((text for text in paragraph_texts if text), _MAX_PARAGRAPHS))
+        
+        tables = []
+        for table in itertools.islice(tree.css('table'), _MAX_TABLES):
+            rows = []
+            headers = []
+            for index, row in enumerate(table.css('tr')):
+                cells = [cell.text().strip() for cell in row.css('td,th')]
+                if index == 0:
+                    headers = cells
+                if cells:
+                    rows.append(cells)
+            if rows:
+                tables.append({'headers': headers, 'rows': rows[:_MAX_TABLE_ROWS], 'row_count': len(rows)})
+        
+        links = []
+        for link in itertools.islice(tree.css('a[href]'), _LINK_SCAN_LIMIT):
+            href = link.attributes.get('href') or ''
+            if _is_skipped_href(href):
+                continue
+            text = link.text().strip()
+            if not text:
+                continue
+            absolute_url = _absolute_url(url, href)
+            if absolute_url:
+                links.append({'text': text, 'url': absolute_url})
+        
+        images = []
+        for img in itertools.islice(tree.css('img'), _IMAGE_SCAN_LIMIT):
+            src = img.attributes.get('src')
+            if src:
+                images.append({'src': _absolute_url(url, src), 'alt': img.attributes.get('alt') or ''})
+        
+        # Same text as the strained soup: only the outermost extracted elements, joined with separators
+        strained = frozenset(_STRAINED_TAGS)
+        text_content = ' '.join(
+            node.text(separator=' ')
+            for node in tree.css(','.join(_STRAINED_TAGS))
+            if not _has_ancestor_in(node, strained)
+        )
         cleaned_text = _clean_text(text_content)
         
         return {
@@ -143,11 +761,11 @@ def _parse_html_content(html: str, url: str) -> Dict[str, Any]:
             "text_content": cleaned_text,
             "word_count": len(cleaned_text.split()),
             "structure": {
-                "headings": headings[:20],  # Limit to first 20 headings
-                "paragraphs": paragraphs[:10],  # Limit to first 10 paragraphs
+                "headings": headings,
+                "paragraphs": paragraphs,
                 "tables": tables,
-                "links": links[:50],  # Limit to first 50 links
-                "images": images[:20]  # Limit to first 20 images
+                "links": links[:_MAX_LINKS],
+                "images": images[:_MAX_IMAGES]
             }
         }
     
@@ -159,29 +777,34 @@ def _parse_html_content(html: str, url: str) -> Dict[str, Any]:
             "url": url
         }
 
+def _has_ancestor_in(node, tags: frozenset) -> bool:
+    parent = node.parent
+    while parent is not None:
+        if parent.tag in tags:
+            return True
+        parent = parent.parent
+    return False
+
 def _extract_tables(soup: BeautifulSoup) -> List[Dict[str, Any]]:
     """Extract table data from HTML."""
     tables = []
     
-    for table in soup.find_all('table'):
+    for table in soup.find_all('table', limit=_MAX_TABLES):
         rows = []
         headers = []
         
-        # Try to find headers
-        header_row = table.find('tr')
-        if header_row:
-            headers = [th.get_text().strip() for th in header_row.find_all(['th', 'td'])]
-        
-        # Extract all rows
-        for row in table.find_all('tr'):
+        # Extract all rows; the first row doubles as the headers, so its cells are only read once
+        for index, row in enumerate(table.find_all('tr')):
             cells = [td.get_text().strip() for td in row.find_all(['td', 'th'])]
+            if index == 0:
+                headers = cells
             if cells:
                 rows.append(cells)
         
         if rows:
             tables.append({
                 'headers': headers,
-                'rows': rows[:50],  # Limit to first 50 rows
+                'rows': rows[:_MAX_TABLE_ROWS],
                 'row_count': len(rows)
             })
     
@@ -191,14 +814,18 @@ def _extract_links(soup: BeautifulSoup, base_url: str) -> List[Dict[str, str]]:
     """Extract links from HTML."""
     links = []
     
-    for link in soup.find_all('a', href=True):
+    for link in soup.find_all('a', href=True, limit=_LINK_SCAN_LIMIT):
         href = link['href']
+        if _is_skipped_href(href):
+            continue
         text = link.get_text().strip()
+        if not text:
+            continue
         
         # Convert relative URLs to absolute
-        absolute_url = urljoin(base_url, href)
+        absolute_url = _absolute_url(base_url, href)
         
-        if text and absolute_url:
+        if absolute_url:
             links.append({
                 'text': text,
                 'url': absolute_url
@@ -210,13 +837,13 @@ def _extract_images(soup: BeautifulSoup, base_url: str) -> List[Dict[str, str]]:
     """Extract image information from HTML."""
     images = []
     
-    for img in soup.find_all('img'):
+    for img in soup.find_all('img', limit=_IMAGE_SCAN_LIMIT):
         src = img.get('src')
         alt = img.get('alt', '')
         
         if src:
             # Convert relative URLs to absolute
-            absolute_url = urljoin(base_url, src)
+            absolute_url = _absolute_url(base_url, src)
             
             images.append({
                 'src': absolute_url,
@@ -225,11 +852,20 @@ def _extract_images(soup: BeautifulSoup, base_url: str) -> List[Dict[str, str]]:
     
     return images
 
-def _parse_json_content(json_text: str, url: str) -> Dict[str, Any]:
-    """Parse JSON content."""
+def _absolute_url(base_url: str, href: str) -> str:
+    """Resolve href against the page URL; already-absolute URLs skip urljoin's parsing."""
+    if href.startswith(_ABSOLUTE_URL_PREFIXES):
+        return href
+    return urljoin(base_url, href)
+
+def _is_skipped_href(href: str) -> bool:
+    """Script, mail and same-page fragment links point nowhere worth scraping."""
+    return href.lstrip().lower().startswith(_SKIPPED_HREF_PREFIXES)
+
+def _parse_json_content(json_content: Union[bytes, str], url: str) -> Dict[str, Any]:
+    """Parse JSON content (raw bytes are parsed without decoding to str first)."""
     try:
-        import json
-        data = json.loads(json_text)
+        data = orjson.loads(json_content)
         
         return {
             "success": True,
@@ -239,7 +875,7 @@ def _parse_json_content(json_text: str, url: str) -> Dict[str, Any]:
             "structure": _analyze_json_structure(data)
         }
     
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         return {
             "success": False,
             "error": f"Invalid JSON: {str(e)}",
@@ -253,18 +889,18 @@ def _parse_csv_content(csv_text: str, url: str) -> Dict[str, Any]:
         import io
         
         reader = csv.reader(io.StringIO(csv_text))
-        rows = list(reader)
-        
-        headers = rows[0] if rows else []
-        data_rows = rows[1:] if len(rows) > 1 else []
+        headers = next(reader, [])
+        data_rows = list(itertools.islice(reader, _MAX_CSV_ROWS))
+        # Keep counting the remainder without holding the rows
+        total_rows = len(data_rows) + sum(1 for _ in reader)
         
         return {
             "success": True,
             "url": url,
             "content_type": "csv",
             "headers": headers,
-            "rows": data_rows[:100],  # Limit to first 100 rows
-            "total_rows": len(data_rows)
+            "rows": data_rows,
+            "total_rows": total_rows
         }
     
     except Exception as e:
@@ -289,45 +925,57 @@ def _parse_text_content(text: str, url: str, content_type: str) -> Dict[str, Any
 
 def _clean_text(text: str) -> str:
     """Clean and normalize text content."""
+    # Only normalize as much as can survive the length cap (with headroom for collapsed whitespace)
+    clipped = len(text) > 2 * _MAX_TEXT_LENGTH
+    if clipped:
+        text = text[:2 * _MAX_TEXT_LENGTH]
+    
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
+    text = _WHITESPACE_RE.sub(' ', text)
     
     # Remove leading/trailing whitespace
     text = text.strip()
     
     # Limit length to prevent memory issues
-    max_length = 50000  # 50KB
-    if len(text) > max_length:
-        text = text[:max_length] + "... [TRUNCATED]"
+    if len(text) > _MAX_TEXT_LENGTH:
+        text = text[:_MAX_TEXT_LENGTH] + "... [TRUNCATED]"
+    elif clipped:
+        text += "... [TRUNCATED]"
     
     return text
 
 def _analyze_json_structure(data: Any, max_depth: int = 3) -> Dict[str, Any]:
-    """Analyze JSON structure recursively."""
-    if max_depth <= 0:
-        return {"type": type(data).__name__, "truncated": True}
+    """Analyze JSON structure with an explicit work stack instead of recursion."""
+    root: Dict[str, Any] = {}
+    # (node, remaining depth, parent container, slot in the parent)
+    stack = [(data, max_depth, root, 'result')]
     
-    if isinstance(data, dict):
-        return {
-            "type": "dict",
-            "keys": list(data.keys())[:10],
-            "key_count": len(data),
-            "sample_values": {
-                k: _analyze_json_structure(v, max_depth - 1)
-                for k, v in list(data.items())[:3]
+    while stack:
+        node, depth, parent, slot = stack.pop()
+        
+        if depth <= 0:
+            parent[slot] = {"type": type(node).__name__, "truncated": True}
+        elif isinstance(node, dict):
+            samples = dict.fromkeys(itertools.islice(node, 3))
+            parent[slot] = {
+                "type": "dict",
+                "keys": list(itertools.islice(node, 10)),
+                "key_count": len(node),
+                "sample_values": samples
             }
-        }
-    elif isinstance(data, list):
-        return {
-            "type": "list",
-            "length": len(data),
-            "sample_items": [
-                _analyze_json_structure(item, max_depth - 1)
-                for item in data[:3]
-            ]
-        }
-    else:
-        return {
-            "type": type(data).__name__,
-            "value": str(data)[:100] if isinstance(data, str) else data
-        }
\ No newline at end of file
+            stack.extend((node[k], depth - 1, samples, k) for k in samples)
+        elif isinstance(node, list):
+            samples = [None] * min(len(node), 3)
+            parent[slot] = {
+                "type": "list",
+                "length": len(node),
+                "sample_items": samples
+            }
+            stack.extend((node[idx], depth - 1, samples, idx) for idx in range(len(samples)))
+        else:
+            parent[slot] = {
+                "type": type(node).__name__,
+                "value": str(node)[:100] if isinstance(node, str) else node
+            }
+    
+    return root['result']
\ No newline at end of file